@@ -1,11 +1,23 @@
-from flask import Flask,current_app
+from flask import Flask, request, url_for
 from .models import db
 from .routes import register_routes
-from .utils.helpers import fetch_and_cache_sets
+from .commands import register_commands
+from .utils.autocomplete import refresh_name_index, reset_name_index
+from .utils.catalog import expire_catalog_version
+from .utils.helpers import fetch_and_cache_sets, start_background_set_sync
+from .utils.images import DERIVED_DIR
+from .utils.metrics import init_metrics
+from .utils.migrations import upgrade_schema
+from .utils.sets import init_set_sprite
+from .utils.snapshot import configure_snapshot, watch_snapshot
+from .utils.storage import ReadOnlyCatalog, init_storage
+from .utils.symbology import init_mana_icons, load_mana_icons, render_symbols
+from .utils.upstream import configure_upstream
 import logging
 import re
 import os
-from markupsafe import Markup
+
+ANSI_ESCAPE = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
 
 def configure_logging(app):
     """Configure logging for the app."""
@@ -20,15 +32,13 @@ def configure_logging(app):
     # Custom filter to strip ANSI escape codes
     class StripColorFilter(logging.Filter):
         def filter(self, record):
-            ansi_escape = re.compile(r'\x1B\[[0-?]*[ -/]*[@-~]')
-            record.msg = ansi_escape.sub('', record.msg)
+            if isinstance(record.msg, str) and '\x1b' in record.msg:
+                record.msg = ANSI_ESCAPE.sub('', record.msg)
             return True
 
     # Add the custom filter to the root logger
     logging.getLogger().addFilter(StripColorFilter())
 
-# For importing the app instance in other modules
-
 def create_app():
     # Initialize Flask application
     app = Flask(__name__,
@@ -49,46 +59,67 @@ def create_app():
     logging.debug(f"Creating database folder at {os.path.dirname(app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', ''))}")
     os.makedirs(os.path.dirname(app.config['SQLALCHEMY_DATABASE_URI'].replace("sqlite:///", "")), exist_ok=True)
 
+    # Web nodes may serve a read-only snapshot instead of DB_PATH
+    snapshot = configure_snapshot(app)
+
     # Initialize database with the Flask app
     db.init_app(app)
+    configure_upstream(app)
 
     # Register routes
     register_routes(app)
 
+    # Register CLI commands (flask import-bulk, ...)
+    register_commands(app)
+
     # Create database tables within the app context
     with app.app_context():
-        db.create_all()
-        fetch_and_cache_sets()
+        init_storage(app)
+        init_metrics(app)
+        if not snapshot:
+            upgrade_schema()
+        init_mana_icons(app)
+        init_set_sprite(app)
+        refresh_name_index()
+
+    # Serve straight away from whatever is in SQLite; sets sync separately
+    startup_sync = app.config['SET_SYNC_ON_STARTUP']
+    if startup_sync == 'blocking':
+        with app.app_context():
+            fetch_and_cache_sets()
+    elif startup_sync == 'background':
+        start_background_set_sync(app)
+
+    def on_snapshot_swap():
+        """Forget everything loaded from the previous snapshot"""
+        expire_catalog_version()
+        reset_name_index()
+        load_mana_icons()
+
+    watch_snapshot(app, on_snapshot_swap)
+
+    @app.errorhandler(ReadOnlyCatalog)
+    def read_only_catalog(e):
+        return "This server has a read-only copy of the catalog", 503
+
+    @app.after_request
+    def cache_derived_images(response):
+        """Derived images and the set icon sprite have content-hashed names, so browsers may keep them forever"""
+        if request.endpoint == 'static' and request.view_args['filename'].startswith(
+                (f"images/{DERIVED_DIR}/", "sets_icons/sprite-")):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 365 * 24 * 60 * 60
+            response.cache_control.immutable = True
+        return response
 
     @app.template_filter('mana_icons')
-    def mana_icons_filter(mana_cost, mana_icons):
-        import re
-        symbols = re.findall(r'\{.*?\}', mana_cost or "")
-        html = ""
-        for symbol in symbols:
-            icon_path = mana_icons.get(symbol)
-            if icon_path:
-                # Use current_app.url_for to generate the URL
-                icon_url = current_app.url_for('static', filename=icon_path)
-                html += f'<img src="{icon_url}" alt="{symbol}" style="width:20px; height:20px; vertical-align:middle;">'
-            else:
-                html += symbol
-        return Markup(html)
+    def mana_icons_filter(mana_cost):
+        return render_symbols(mana_cost, url_for('static', filename=''))
 
     @app.template_filter('oracle_icons')
-    def oracle_icons_filter(text, mana_icons):
-        # Find all symbols like {1}, {R}, {T}, etc.
-        symbols = re.findall(r'\{.*?\}', text or "")
-        html = text or ""
-        for symbol in set(symbols):  # Use set to avoid replacing the same symbol multiple times
-            icon_path = mana_icons.get(symbol)
-            if icon_path:
-                icon_url = current_app.url_for('static', filename=icon_path)
-                img_tag = f'<img src="{icon_url}" alt="{symbol}" style="width:20px; height:20px; vertical-align:middle;">'
-                html = html.replace(symbol, img_tag)
-        return Markup(html)
-
+    def oracle_icons_filter(text):
+        return render_symbols(text, url_for('static', filename=''))
 
     return app
 
-app = create_app()
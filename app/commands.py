@@ -0,0 +1,79 @@
+import click
+import requests
+from flask import current_app
+
+from .utils.assets import get_asset_fetcher
+from .utils.helpers import sync_sets_locked
+from .utils.images import backfill_derivatives, derivatives_supported
+from .utils.importer import import_bulk_data_from_file
+from .utils.sets import build_set_sprite
+from .utils.similar import build_similarity_index, similarity_supported
+from .utils.snapshot import build_snapshot
+from .utils.symbology import refresh_mana_icons
+
+
+def register_commands(app):
+    @app.cli.command("import-bulk")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--batch-size", type=int, default=None,
+                  help="Number of cards written per transaction.")
+    @click.option("--incremental", is_flag=True,
+                  help="Only upsert cards that changed since the last import.")
+    def import_bulk(path, batch_size, incremental):
+        """Import a Scryfall bulk data file (.json or .json.gz)."""
+        writer = import_bulk_data_from_file(path, batch_size=batch_size, incremental=incremental)
+        if incremental:
+            click.echo(f"Synced {writer.written} cards from {path}: {writer.inserted} inserted, "
+                       f"{writer.updated} updated, {writer.unchanged} unchanged")
+        else:
+            click.echo(f"Imported {writer.written} cards from {path}")
+
+    @app.cli.command("refresh-symbols")
+    def refresh_symbols():
+        """Fetch mana symbols from Scryfall and cache their SVGs."""
+        try:
+            icons = refresh_mana_icons(current_app._get_current_object())
+        except requests.RequestException as e:
+            raise click.ClickException(f"Could not reach Scryfall: {e}")
+        click.echo(f"Cached {len(icons)} mana symbols")
+
+    @app.cli.command("sync-sets")
+    def sync_sets():
+        """Fetch the set list from Scryfall and queue missing set icons."""
+        app = current_app._get_current_object()
+        new_sets = sync_sets_locked(app, force=True)
+        if new_sets is None:
+            raise click.ClickException("Set sync failed, see the log for details")
+        click.echo(f"Added {new_sets} new sets, waiting for icon downloads...")
+        get_asset_fetcher(app).shutdown()
+        sprite = build_set_sprite(app)
+        if sprite:
+            click.echo(f"Set icon sprite: {sprite}")
+
+    @app.cli.command("build-thumbnails")
+    @click.option("--force", is_flag=True, help="Rebuild derivatives that already exist.")
+    def build_thumbnails(force):
+        """Create resized derivatives for card images that are already downloaded."""
+        if not derivatives_supported():
+            raise click.ClickException("Pillow is not installed (pip install pillow)")
+        updated = backfill_derivatives(current_app._get_current_object(), force=force)
+        click.echo(f"Built derivatives for {updated} card images")
+
+    @app.cli.command("build-similar")
+    def build_similar():
+        """Build the "similar cards" index; run it again after importing new cards."""
+        if not similarity_supported():
+            raise click.ClickException("NumPy is not installed (pip install numpy)")
+        directory = current_app.config["SIMILAR_INDEX_DIR"]
+        count = build_similarity_index(directory, current_app.config["SIMILAR_INDEX_DIM"])
+        click.echo(f"Indexed {count} cards in {directory}")
+
+    @app.cli.command("build-snapshot")
+    @click.argument("output", type=click.Path(dir_okay=False))
+    def build_snapshot_command(output):
+        """Write a compacted, read-only copy of the catalog for web nodes (SNAPSHOT_PATH)."""
+        app = current_app._get_current_object()
+        if app.config["SNAPSHOT_PATH"]:
+            raise click.ClickException("Build snapshots from the writable database, not from a snapshot")
+        version = build_snapshot(app, output)
+        click.echo(f"Built snapshot {version} at {output}")
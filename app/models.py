@@ -4,6 +4,14 @@ db = SQLAlchemy()
 
 class Card(db.Model):
     __tablename__ = 'card'
+    __table_args__ = (
+        # Keyset pagination seeks on (name, id), within a set or across the catalog
+        db.Index('ix_card_name_id', 'name', 'id'),
+        db.Index('ix_card_set_code_name_id', 'set_code', 'name', 'id'),
+        # Color filters become IN-lists over these (see utils/colors.py)
+        db.Index('ix_card_color_mask_name_id', 'color_mask', 'name', 'id'),
+        db.Index('ix_card_color_identity_mask_name_id', 'color_identity_mask', 'name', 'id'),
+    )
 
     id = db.Column(db.String, primary_key=True)  # Scryfall ID
     oracle_id = db.Column(db.String, index=True)  # Scryfall Oracle ID
@@ -24,10 +32,15 @@ class Card(db.Model):
     mana_costs = db.Column(db.String)
     image_uri = db.Column(db.String)
     local_image_path = db.Column(db.String)
+    thumb_image_path = db.Column(db.String)  # Content-hashed derivatives, see utils/images.py
+    detail_image_path = db.Column(db.String)
     scryfall_uri = db.Column(db.String)
     rulings_uri = db.Column(db.String)
     legalities = db.Column(db.Text)
     prints_search_uri = db.Column(db.String)
+    content_hash = db.Column(db.String)  # Fingerprint of the imported Scryfall data
+    color_mask = db.Column(db.Integer)  # WUBRG bits + colorless flag, see utils/colors.py
+    color_identity_mask = db.Column(db.Integer)
 
     # Relationships
     set = db.relationship("Set", back_populates="cards")
@@ -36,6 +49,14 @@ class Card(db.Model):
 
 class Set(db.Model):
     __tablename__ = 'set'
+    __table_args__ = (
+        # The sets page filters by type and sorts by name or release date
+        db.Index('ix_set_code', 'code'),
+        db.Index('ix_set_name_code', 'name', 'code'),
+        db.Index('ix_set_released_at_code', 'released_at', 'code'),
+        db.Index('ix_set_set_type_name_code', 'set_type', 'name', 'code'),
+        db.Index('ix_set_set_type_released_at_code', 'set_type', 'released_at', 'code'),
+    )
 
     id = db.Column(db.String, primary_key=True)
     code = db.Column(db.String)
@@ -47,6 +68,19 @@ class Set(db.Model):
 
     cards = db.relationship("Card", back_populates="set")
 
+class SetSummary(db.Model):
+    """Card counts per set, recounted on ingest (see utils/sets.py)"""
+    __tablename__ = 'set_summary'
+
+    set_code = db.Column(db.String, primary_key=True)
+    card_count = db.Column(db.Integer, nullable=False, default=0)
+    cached_count = db.Column(db.Integer, nullable=False, default=0)  # Cards with a local image copy
+    common_count = db.Column(db.Integer, nullable=False, default=0)
+    uncommon_count = db.Column(db.Integer, nullable=False, default=0)
+    rare_count = db.Column(db.Integer, nullable=False, default=0)
+    mythic_count = db.Column(db.Integer, nullable=False, default=0)
+    other_count = db.Column(db.Integer, nullable=False, default=0)  # Special, bonus, ...
+
 class Color(db.Model):
     __tablename__ = 'color'
 
@@ -63,15 +97,81 @@ class Type(db.Model):
 
     cards = db.relationship("Card", secondary="card_types", back_populates="types")
 
+class ManaSymbol(db.Model):
+    __tablename__ = 'mana_symbol'
+
+    symbol = db.Column(db.String, primary_key=True)  # e.g. '{R}', '{2/W}'
+    svg_uri = db.Column(db.String)
+    local_path = db.Column(db.String)  # Relative to the static folder, e.g. 'mana/R.svg'
+
+class HttpCacheEntry(db.Model):
+    __tablename__ = 'http_cache'
+
+    key = db.Column(db.String, primary_key=True)  # sha1 of URL + sorted params
+    url = db.Column(db.String)
+    status_code = db.Column(db.Integer)
+    content_type = db.Column(db.String)
+    etag = db.Column(db.String)
+    last_modified = db.Column(db.String)
+    body = db.Column(db.LargeBinary)
+    fetched_at = db.Column(db.Float)  # Unix time of the last successful fetch or revalidation
+
+class CatalogMeta(db.Model):
+    __tablename__ = 'catalog_meta'
+
+    key = db.Column(db.String, primary_key=True)  # e.g. 'bulk_imported_at'
+    value = db.Column(db.String)
+
+class SavedCard(db.Model):
+    __tablename__ = 'saved_card'
+
+    card_id = db.Column(db.String, db.ForeignKey('card.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    added_at = db.Column(db.Float)  # Unix time the card was first saved
+
+    card = db.relationship("Card")
+
+class Deck(db.Model):
+    __tablename__ = 'deck'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    created_at = db.Column(db.Float)
+
+    cards = db.relationship("DeckCard", back_populates="deck", cascade="all, delete-orphan")
+
+class DeckCard(db.Model):
+    __tablename__ = 'deck_card'
+
+    deck_id = db.Column(db.Integer, db.ForeignKey('deck.id'), primary_key=True)
+    card_id = db.Column(db.String, db.ForeignKey('card.id'), primary_key=True)
+    board = db.Column(db.String, primary_key=True, default='main')  # 'main', 'sideboard', 'commander', ...
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+
+    deck = db.relationship("Deck", back_populates="cards")
+    card = db.relationship("Card")
+
 # Association tables for many-to-many relations
 card_colors = db.Table('card_colors',
     db.Column('card_id', db.String, db.ForeignKey('card.id'), primary_key=True),
-    db.Column('color_id', db.String, db.ForeignKey('color.id'), primary_key=True)
+    db.Column('color_id', db.String, db.ForeignKey('color.id'), primary_key=True),
+    db.Index('ix_card_colors_color_id', 'color_id', 'card_id')
 )
 
 card_types = db.Table('card_types',
     db.Column('card_id', db.String, db.ForeignKey('card.id'), primary_key=True),
-    db.Column('type_id', db.String, db.ForeignKey('type.id'), primary_key=True)
+    db.Column('type_id', db.String, db.ForeignKey('type.id'), primary_key=True),
+    db.Index('ix_card_types_type_id', 'type_id', 'card_id')
+)
+
+# Per-format legality, one row per format the card is legal, restricted or
+# banned in ("not_legal" is left out); the raw JSON stays on Card.legalities
+card_legalities = db.Table('card_legalities',
+    db.Column('card_id', db.String, db.ForeignKey('card.id'), primary_key=True),
+    db.Column('format', db.String, primary_key=True),  # e.g. 'modern', 'commander'
+    db.Column('status', db.String, nullable=False),  # 'legal', 'restricted' or 'banned'
+    db.Index('ix_card_legalities_format_status', 'format', 'status', 'card_id'),
+    sqlite_with_rowid=False  # The primary key is the only copy of each row
 )
 
 # Define the association table for the many-to-many relationship between Card and Set
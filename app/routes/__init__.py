@@ -1,4 +1,8 @@
+from .api import api_bp
 from .cards import card_bp
+from .metrics import metrics_bp
 
 def register_routes(app):
     app.register_blueprint(card_bp)
+    app.register_blueprint(api_bp)
+    app.register_blueprint(metrics_bp)
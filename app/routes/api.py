@@ -0,0 +1,134 @@
+from flask import Blueprint, Response, abort, current_app, request, jsonify, stream_with_context
+from ..models import db, Card, Deck, DeckCard, SavedCard, Set
+from ..utils.autocomplete import autocomplete as complete_name
+from ..utils.decklist import DecklistError, create_deck, parse_decklist, resolve_decklist, save_cards
+from ..utils.export import DEFAULT_PAGE_SIZE, fetch_cards_page, parse_fields, select_cards, stream_cards
+
+
+api_bp = Blueprint("api", __name__, url_prefix="/api")
+
+@api_bp.route("/autocomplete")
+def autocomplete():
+    """Card names for type-ahead, served from the in-memory name index"""
+    query = request.args.get("q", "")
+    limit = request.args.get("limit", 10, type=int)
+    response = jsonify({"object": "catalog", "data": complete_name(query, max(limit, 1))})
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+def _card_listing(set_code=None):
+    """Search results as JSON pages, or the whole result as NDJSON.
+
+    q: Scryfall-style query; fields: comma-separated projection (or *);
+    limit and cursor: paging; format=ndjson (or Accept:
+    application/x-ndjson): stream every match, starting after cursor.
+    """
+    try:
+        selection = select_cards(
+            parse_fields(request.args.get("fields")),
+            request.args.get("q"),
+            set_code=set_code,
+            cursor=request.args.get("cursor"),
+        )
+    except ValueError as e:  # Includes QueryError
+        return jsonify({"error": str(e)}), 400
+
+    if request.args.get("format") == "ndjson" or request.accept_mimetypes.best == "application/x-ndjson":
+        return Response(stream_with_context(stream_cards(selection)), mimetype="application/x-ndjson")
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    page = fetch_cards_page(selection, limit)
+    # jsonify sorts keys; keep each card's fields in fields= order, as the NDJSON stream does
+    return Response(current_app.json.dumps(page, sort_keys=False) + "\n", mimetype="application/json")
+
+@api_bp.route("/cards/search")
+def search_cards():
+    return _card_listing()
+
+@api_bp.route("/sets/<set_code>/cards")
+def set_cards(set_code):
+    set_code = set_code.lower()
+    if not db.session.query(Set.query.filter_by(code=set_code).exists()).scalar():
+        return jsonify({"error": f"Unknown set: {set_code}"}), 404
+    return _card_listing(set_code)
+
+def _line_to_dict(line, printing):
+    return {
+        "line": line.number,
+        "quantity": line.quantity,
+        "name": line.name,
+        "set": line.set_code,
+        "collector_number": line.collector_number,
+        "board": line.board,
+        "card": printing._asdict() if printing else None,
+    }
+
+@api_bp.route("/decklist", methods=["POST"])
+def decklist():
+    """Resolve a whole decklist in one batch.
+
+    Takes the list as text/plain, a `decklist` form field or JSON
+    {"decklist": ...}. With `deck` (a name) the resolved cards are stored
+    as a new deck; with `save=1` they're added to the saved collection.
+    """
+    payload = request.get_json(silent=True) or {}
+    text = payload.get("decklist") or request.form.get("decklist")
+    if text is None and request.mimetype == "text/plain":
+        text = request.get_data(as_text=True)
+    options = dict(request.args, **request.form, **{k: v for k, v in payload.items() if k != "decklist"})
+    try:
+        lines = parse_decklist(text)
+    except DecklistError as e:
+        return jsonify({"error": str(e)}), 400
+    if not lines:
+        return jsonify({"error": "No cards found in the decklist"}), 400
+
+    resolved = resolve_decklist(lines)
+    result = {
+        "data": [_line_to_dict(line, printing) for line, printing in zip(lines, resolved)],
+        "not_found": [line.number for line, printing in zip(lines, resolved) if printing is None],
+    }
+    if options.get("deck"):
+        result["deck_id"] = create_deck(str(options["deck"]), lines, resolved)
+    elif str(options.get("save", "")) in ("1", "true"):
+        quantities = {}
+        for line, printing in zip(lines, resolved):
+            if printing:
+                quantities[printing.id] = quantities.get(printing.id, 0) + line.quantity
+        save_cards(quantities)
+    return jsonify(result)
+
+@api_bp.route("/collection")
+def collection():
+    rows = (
+        db.session.query(SavedCard.quantity, Card.id, Card.name, Card.set_code, Card.collector_number)
+        .join(Card, Card.id == SavedCard.card_id)
+        .order_by(Card.name, Card.id)
+        .all()
+    )
+    return jsonify({"data": [
+        {"quantity": quantity, "id": card_id, "name": name, "set_code": set_code, "collector_number": number}
+        for quantity, card_id, name, set_code, number in rows
+    ]})
+
+@api_bp.route("/decks/<int:deck_id>")
+def deck(deck_id):
+    deck = db.session.get(Deck, deck_id)
+    if not deck:
+        abort(404)
+    rows = (
+        db.session.query(DeckCard.board, DeckCard.quantity, Card.id, Card.name, Card.set_code, Card.collector_number)
+        .join(Card, Card.id == DeckCard.card_id)
+        .filter(DeckCard.deck_id == deck_id)
+        .order_by(DeckCard.board, Card.name)
+        .all()
+    )
+    return jsonify({
+        "id": deck.id,
+        "name": deck.name,
+        "cards": [
+            {"board": board, "quantity": quantity, "id": card_id, "name": name, "set_code": set_code,
+             "collector_number": number}
+            for board, quantity, card_id, name, set_code, number in rows
+        ],
+    })
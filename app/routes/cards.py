@@ -1,6 +1,12 @@
-from flask import Blueprint, request, jsonify, render_template
-from ..models import Card, Set
-from ..utils.helpers import download_image,fetch_and_cache_cards, fetch_and_cache_mana_icons, fetch_reprints
+from flask import Blueprint, abort, current_app, redirect, request, jsonify, render_template, url_for
+from ..models import Card, Deck, DeckCard, SavedCard, Set
+from ..utils.helpers import download_image,fetch_and_cache_cards, fetch_card_page, fetch_and_cache_mana_icons, fetch_reprints
+from ..utils.fragments import cached_fragment, send_fragment
+from ..utils.decklist import DecklistError, create_deck, parse_decklist, remove_saved_card, resolve_decklist, save_cards
+from ..utils.catalog import get_meta
+from ..utils.query import QueryError
+from ..utils.sets import SPRITE_META_KEY, list_sets, set_types
+from ..utils.similar import similar_cards
 from ..models import db
 import logging
 
@@ -10,9 +16,8 @@ card_bp = Blueprint("cards", __name__)
 
 @card_bp.route("/", methods=["GET", "POST"])
 def index():
-    cards = []
-    error = None
     page = request.args.get("page", 1, type=int)
+    cursor = request.args.get("cursor")
     per_page = 20
 
     query = None
@@ -20,75 +25,100 @@ def index():
         query = request.form.get("query")
     elif request.method == "GET":
         query = request.args.get("query")
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
-    if query:
-        cards = fetch_and_cache_cards(search_string=query, page=page, per_page=per_page)
+    def render():
+        cards = []
+        next_cursor = None
+        error = None
+        if query:
+            try:
+                cards, next_cursor = fetch_card_page(search_string=query, page=page, cursor=cursor, per_page=per_page)
+            except QueryError as e:
+                error = f"Invalid search: {e}"
+            except ValueError:
+                abort(400)
 
-    # AJAX: return only the cards grid partial
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        if not cards:
-            return '', 204
-        return render_template("partials/card_grid.html", cards=cards)
+        # AJAX: return only the cards grid partial
+        if is_ajax:
+            return render_template("partials/card_grid.html", cards=cards, next_cursor=next_cursor) if cards else ''
+        return render_template("index.html", cards=cards, next_cursor=next_cursor, error=error, query=query)
 
-    return render_template("index.html", cards=cards, error=error, query=query)
+    fragment = cached_fragment(("index", query, page, cursor, is_ajax), render)
+    return send_fragment(fragment, empty_status=204)
 
 
 @card_bp.route("/sets", methods=["GET"])
 def sets():
     sort = request.args.get('sort', 'name')  # Default sort by name
     direction = request.args.get('direction', 'asc')  # Default sort direction
-
-    if sort == 'name':
-        if direction == 'asc':
-            sets = Set.query.order_by(Set.name.asc()).all()
-        else:
-            sets = Set.query.order_by(Set.name.desc()).all()
-    elif sort == 'date':
-        if direction == 'asc':
-            sets = Set.query.order_by(Set.released_at.asc()).all()
-        else:
-            sets = Set.query.order_by(Set.released_at.desc()).all()
-    else:
-        sets = Set.query.all()
-
-    return render_template("sets.html", sets=sets)
+    set_type = request.args.get('type') or None
+    if sort not in ('name', 'date') or direction not in ('asc', 'desc'):
+        sort, direction = 'name', 'asc'
+
+    def render():
+        # Filtered and sorted in SQL on the set indexes; icons come from one sprite
+        return render_template(
+            "sets.html",
+            sets=list_sets(set_type, sort, direction),
+            set_types=set_types(),
+            set_type=set_type,
+            sort=sort,
+            direction=direction,
+            sprite=get_meta(SPRITE_META_KEY),
+        )
+
+    return send_fragment(cached_fragment(("sets", set_type, sort, direction), render))
 
 @card_bp.route('/sets/<set_code>')
 def set_detail(set_code):
     page = request.args.get('page', 1, type=int)
-    selected_set = Set.query.filter_by(code=set_code).first_or_404()
-    cards = fetch_and_cache_cards(
-        selected_sets=[set_code],
-        page=page,
-        per_page=20
-    )
+    cursor = request.args.get('cursor')
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
 
-    # If AJAX, return only the cards grid partial
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        if not cards:
-            return '', 204  # No Content
-        return render_template('partials/card_grid.html', cards=cards)
+    def render():
+        selected_set = Set.query.filter_by(code=set_code).first_or_404()
+        try:
+            cards, next_cursor = fetch_card_page(
+                selected_sets=[set_code],
+                page=page,
+                cursor=cursor,
+                per_page=20
+            )
+        except ValueError:
+            abort(400)
 
-    # Otherwise, render the full page
-    return render_template(
-        'set_detail.html',
-        cards=cards,
-        selected_set=selected_set
-    )
+        # If AJAX, return only the cards grid partial
+        if is_ajax:
+            return render_template('partials/card_grid.html', cards=cards, next_cursor=next_cursor) if cards else ''
+
+        # Otherwise, render the full page
+        return render_template(
+            'set_detail.html',
+            cards=cards,
+            next_cursor=next_cursor,
+            selected_set=selected_set
+        )
+
+    fragment = cached_fragment(("set", set_code, page, cursor, is_ajax), render)
+    return send_fragment(fragment, empty_status=204)
 
 
 @card_bp.route('/card/<card_id>')
 def card_detail(card_id):
-    card = Card.query.get(card_id)
-    if not card:
-        return "Card not found", 404
+    def render():
+        card = db.session.get(Card, card_id)
+        if not card:
+            abort(404, "Card not found")
 
-    card_set = card.set if card.set else None
-    mana_icons = fetch_and_cache_mana_icons()  # Fetch mana icons from Scryfall API
-    reprints = fetch_reprints(card)  # Fetch reprints from Scryfall API
-    logging.info(f"Reprints found: {reprints}")
+        card_set = card.set if card.set else None
+        reprints = fetch_reprints(card)  # Other printings, from the local oracle_id index
+        logging.debug(f"{len(reprints)} reprints of {card.name}")
+        similar = similar_cards(current_app._get_current_object(), card)
 
-    return render_template('card_detail.html', card=card, card_set=card_set, mana_icons=mana_icons, reprints=reprints)
+        return render_template('card_detail.html', card=card, card_set=card_set, reprints=reprints, similar=similar)
+
+    return send_fragment(cached_fragment(("card", card_id), render))
 
 @card_bp.route("/advanced_search", methods=["GET", "POST"])
 def advanced_search():
@@ -96,7 +126,8 @@ def advanced_search():
     sets = Set.query.all()
     card_types = ["Creature", "Enchantment", "Instant", "Sorcery", "Artifact", "Land", "Planeswalker"]
     colors = ["White", "Blue", "Black", "Red", "Green"]
-    mana_icons = fetch_and_cache_mana_icons()  # Fetch mana icons from Scryfall API
+    formats = ["Standard", "Pioneer", "Modern", "Legacy", "Vintage", "Pauper", "Commander", "Brawl"]
+    mana_icons = fetch_and_cache_mana_icons()  # Served from the local symbology cache
 
 
     error = None
@@ -106,6 +137,7 @@ def advanced_search():
     if request.method == "POST":
         card_name = request.form.get("cardName")
         card_type = request.form.get("cardType")
+        card_format = request.form.get("cardFormat")
         selected_colors = request.form.getlist("colors")
         selected_sets = request.form.getlist("sets")
         unique_oracle_id = request.form.get("unique_oracle_id") == "1"
@@ -114,9 +146,10 @@ def advanced_search():
             cards = fetch_and_cache_cards(
                 card_name=card_name,
                 card_type=card_type,
+                card_format=card_format,
                 selected_colors=selected_colors,
                 selected_sets=selected_sets,
-                unique_oracle_id=unique_oracle_id
+                unique_cards=unique_oracle_id
             )
             total_items = len(cards)
         except Exception as e:
@@ -128,20 +161,85 @@ def advanced_search():
         total_items=total_items,
         card_types=card_types,
         colors=colors,
+        formats=formats,
         sets=sets,
         mana_icons=mana_icons,
         error=error
     )
 
-if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()
-        fetch_and_cache_sets()
-
-        # Check if the import file exists at startup
-        import_file_path = "import/import.json"  # Update this path to the location of your bulk data file
-        if os.path.exists(import_file_path):
-            logging.info("Found import.json file, staring import")
-            # import_bulk_data_from_file(import_file_path)
 
-    app.run(debug=True)
\ No newline at end of file
+@card_bp.route("/save", methods=["POST"])
+def save_card():
+    card_id = request.form.get("id")
+    if not card_id or not db.session.get(Card, card_id):
+        abort(404)
+    save_cards({card_id: 1})
+    return redirect(request.referrer or url_for("cards.favorites"))
+
+@card_bp.route("/favorites/remove", methods=["POST"])
+def remove_favorite():
+    remove_saved_card(request.form.get("id"))
+    return redirect(url_for("cards.favorites"))
+
+def _favorites_page(**context):
+    saved = (
+        db.session.query(SavedCard.quantity, Card)
+        .join(Card, Card.id == SavedCard.card_id)
+        .order_by(Card.name, Card.id)
+        .all()
+    )
+    decks = (
+        db.session.query(Deck, db.func.coalesce(db.func.sum(DeckCard.quantity), 0))
+        .outerjoin(DeckCard, DeckCard.deck_id == Deck.id)
+        .group_by(Deck.id)
+        .order_by(Deck.created_at.desc())
+        .all()
+    )
+    return render_template("favorites.html", saved=saved, decks=decks, **context)
+
+@card_bp.route("/favorites")
+def favorites():
+    return _favorites_page()
+
+@card_bp.route("/favorites/import", methods=["POST"])
+def import_decklist():
+    """Resolve a pasted decklist and save it as a deck, or add it to the collection"""
+    text = request.form.get("decklist", "")
+    deck_name = request.form.get("deck_name", "").strip()
+    try:
+        lines = parse_decklist(text)
+    except DecklistError as e:
+        return _favorites_page(error=str(e), decklist=text, deck_name=deck_name), 400
+    if not lines:
+        return _favorites_page(error="No cards found in the decklist", decklist=text, deck_name=deck_name), 400
+
+    resolved = resolve_decklist(lines)
+    unresolved = [line for line, printing in zip(lines, resolved) if printing is None]
+    if deck_name:
+        deck_id = create_deck(deck_name, lines, resolved)
+        if not unresolved:
+            return redirect(url_for("cards.deck_detail", deck_id=deck_id))
+    else:
+        quantities = {}
+        for line, printing in zip(lines, resolved):
+            if printing:
+                quantities[printing.id] = quantities.get(printing.id, 0) + line.quantity
+        save_cards(quantities)
+    return _favorites_page(unresolved=unresolved, imported=len(lines) - len(unresolved))
+
+@card_bp.route("/decks/<int:deck_id>")
+def deck_detail(deck_id):
+    deck = db.session.get(Deck, deck_id)
+    if not deck:
+        abort(404)
+    entries = (
+        db.session.query(DeckCard.board, DeckCard.quantity, Card)
+        .join(Card, Card.id == DeckCard.card_id)
+        .filter(DeckCard.deck_id == deck_id)
+        .order_by(DeckCard.board, Card.name)
+        .all()
+    )
+    boards = {}
+    for board, quantity, card in entries:
+        boards.setdefault(board, []).append((quantity, card))
+    return render_template("deck.html", deck=deck, boards=boards)
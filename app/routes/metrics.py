@@ -0,0 +1,10 @@
+from flask import Blueprint, Response
+from ..utils.metrics import render_metrics
+
+
+metrics_bp = Blueprint("metrics", __name__)
+
+@metrics_bp.route("/metrics")
+def metrics():
+    """Prometheus scrape endpoint (per process)"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
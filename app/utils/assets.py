@@ -0,0 +1,229 @@
+"""Background fetching of card images and set icons.
+
+All downloads share one pooled HTTP session and a process-wide rate limit
+that follows Scryfall's guidance (about 10 requests per second). Jobs run
+on a bounded thread pool so requests never wait for image downloads;
+templates fall back to the remote image_uri until the local copy lands.
+Card images are resized into thumbnails on the same workers.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..models import db, Card, Set
+from .images import derivative_columns, make_derivatives
+from .metrics import record_upstream
+from .sets import refresh_set_summaries, schedule_sprite_build
+from .storage import queue_write
+from .upstream import guarded_send
+
+USER_AGENT = "mtg-db/1.0"
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+scryfall_rate_limiter = RateLimiter(10)
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Records every outbound request (retries included) for /metrics
+
+    Requests also pass through the host's concurrency limit and circuit
+    breaker (see upstream.py).
+    """
+
+    def send(self, request, **kwargs):
+        host = urlsplit(request.url).hostname or ""
+        return guarded_send(host, lambda: self._timed_send(host, request, **kwargs))
+
+    def _timed_send(self, host, request, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            record_upstream(host, time.perf_counter() - started)
+            raise
+        record_upstream(host, time.perf_counter() - started, response.status_code)
+        return response
+
+
+def get_http_session():
+    """Process-wide pooled session with retry/backoff for Scryfall and its CDN"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            retry = Retry(
+                total=3,
+                connect=1,  # Sustained outages are left to the circuit breaker (upstream.py)
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET", "HEAD"),
+                respect_retry_after_header=True,
+            )
+            adapter = TimedHTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"User-Agent": USER_AGENT, "Accept": "*/*"})
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+def download_file(url, save_path, timeout=30):
+    """Download url to save_path atomically (temp file + rename); True on success"""
+    if os.path.exists(save_path):
+        return True
+
+    directory = os.path.dirname(save_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    scryfall_rate_limiter.wait()
+    try:
+        response = get_http_session().get(url, timeout=timeout, stream=True)
+    except requests.RequestException as e:
+        logging.error(f"Error downloading {url}: {e}")
+        return False
+    if response.status_code != 200:
+        logging.error(f"Failed to download {url}: {response.status_code}")
+        response.close()
+        return False
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".download-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
+        os.chmod(temp_path, 0o644)  # mkstemp creates files readable by the owner only
+        os.replace(temp_path, save_path)
+    except Exception as e:
+        logging.error(f"Error saving {url} to {save_path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    finally:
+        response.close()
+    logging.debug(f"Downloaded {url} to {save_path}")
+    return True
+
+
+class AssetFetcher:
+    """Bounded worker pool that downloads files and reports back via callbacks"""
+
+    def __init__(self, app, max_workers):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asset-fetch")
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def submit(self, url, save_path, on_done=None):
+        """Queue a download; duplicates of an in-flight job are dropped"""
+        with self.lock:
+            if save_path in self.pending:
+                return False
+            self.pending.add(save_path)
+        self.executor.submit(self._run, url, save_path, on_done)
+        return True
+
+    def shutdown(self):
+        """Wait for every queued download to finish (used by CLI commands)"""
+        self.executor.shutdown(wait=True)
+
+    def _run(self, url, save_path, on_done):
+        try:
+            ok = download_file(url, save_path)
+            if ok and on_done:
+                with self.app.app_context():
+                    on_done()
+        except Exception as e:
+            logging.error(f"Asset job for {url} failed: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(save_path)
+
+
+_fetcher = None
+_fetcher_pid = None
+
+
+def get_asset_fetcher(app):
+    """The per-process fetcher, created lazily so forked workers get their own threads"""
+    global _fetcher, _fetcher_pid
+    with _session_lock:
+        if _fetcher is None or _fetcher_pid != os.getpid():
+            scryfall_rate_limiter.interval = 1.0 / app.config["SCRYFALL_RATE_LIMIT"]
+            _fetcher = AssetFetcher(app, app.config["ASSET_WORKERS"])
+            _fetcher_pid = os.getpid()
+        return _fetcher
+
+
+def _update_card(card_id, values):
+    db.session.query(Card).filter_by(id=card_id).update(values)
+    if "local_image_path" in values:
+        # The set's cached-card count
+        refresh_set_summaries([db.session.query(Card.set_code).filter_by(id=card_id).scalar()])
+
+
+def _update_set_icon(set_code, local_icon_path):
+    db.session.query(Set).filter_by(code=set_code).update({"local_icon_path": local_icon_path})
+
+
+def queue_card_images(app, cards):
+    """Fetch local copies of card images in the background"""
+    if not app.config["CACHE_IMAGES"]:
+        return
+    fetcher = get_asset_fetcher(app)
+    for card in cards:
+        if card.local_image_path or not card.image_uri:
+            continue
+        filename = f"{card.id}.jpg"
+        save_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+        local_path = os.path.join(app.config["IMAGE_PATH"], filename)
+
+        def record(card_id=card.id, save_path=save_path, local_path=local_path):
+            # Resize on the worker thread, then record everything in one update
+            paths = make_derivatives(save_path, app.config["UPLOAD_FOLDER"], app.config["IMAGE_PATH"], card_id)
+            values = {"local_image_path": local_path, **derivative_columns(paths)}
+            queue_write(_update_card, card_id, values)
+
+        fetcher.submit(card.image_uri, save_path, record)
+
+
+def queue_set_icon(app, set_code, icon_url):
+    """Fetch a set's SVG icon in the background and record its local path"""
+    filename = f"{set_code}.svg"
+    save_path = os.path.join(app.static_folder, "sets_icons", filename)
+
+    def record():
+        queue_write(_update_set_icon, set_code, f"sets_icons/{filename}")
+        schedule_sprite_build(app)
+
+    get_asset_fetcher(app).submit(icon_url, save_path, record)
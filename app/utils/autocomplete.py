@@ -0,0 +1,138 @@
+"""In-memory card name index for type-ahead (/api/autocomplete).
+
+Distinct card names are kept in two sorted lists of folded keys (lower
+case, accents stripped): whole names, and every later word of a name so
+"bolt" also finds "Lightning Bolt". A lookup is a bisect plus a short
+scan, so keystrokes never reach SQLite.
+
+The index is built at startup. When the catalog version changes it only
+loads names of cards added since the last refresh (by rowid). Upserts
+keep a card's rowid, so a full rebuild happens when an import has
+rewritten existing cards (catalog_meta "cards_rewritten" changed) or the
+card table shrank, e.g. a different database.
+"""
+import bisect
+import logging
+import threading
+import time
+import unicodedata
+
+from sqlalchemy import func, literal_column
+
+from ..models import db, Card
+from .catalog import get_catalog_version, get_meta
+
+MAX_RESULTS = 25
+
+_rowid = literal_column("card.rowid")
+
+
+def fold(text):
+    """Case- and accent-insensitive key: 'Æther Vial' -> 'aether vial'"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).replace("æ", "ae")
+
+
+class NameIndex:
+    def __init__(self):
+        self.names = set()
+        self.full = []  # sorted (folded name, name)
+        self.words = []  # sorted (folded name from a later word on, name)
+        self.last_rowid = 0
+        self.version = None
+        self.rewritten = None  # catalog_meta "cards_rewritten" when built
+
+    def add(self, names):
+        """Merge names into the index; returns how many were new"""
+        new = sorted(set(names) - self.names)
+        if not new:
+            return 0
+        self.names.update(new)
+        full = []
+        words = []
+        for name in new:
+            key = fold(name)
+            full.append((key, name))
+            for i, ch in enumerate(key):
+                if i and ch.isalnum() and not key[i - 1].isalnum():
+                    words.append((key[i:], name))
+        # Small ingests insort; big batches (startup) are cheaper to re-sort
+        if len(full) < 64:
+            for entry in full:
+                bisect.insort(self.full, entry)
+            for entry in words:
+                bisect.insort(self.words, entry)
+        else:
+            self.full = sorted(self.full + full)
+            self.words = sorted(self.words + words)
+        return len(new)
+
+    @staticmethod
+    def _scan(entries, prefix, limit, seen, results):
+        i = bisect.bisect_left(entries, (prefix,))
+        while i < len(entries) and len(results) < limit:
+            key, name = entries[i]
+            if not key.startswith(prefix):
+                break
+            if name not in seen:
+                seen.add(name)
+                results.append(name)
+            i += 1
+
+    def search(self, query, limit=10):
+        """Names starting with query, then names with a word starting with it"""
+        prefix = fold(query.strip())
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        self._scan(self.full, prefix, limit, seen, results)
+        self._scan(self.words, prefix, limit, seen, results)
+        return results
+
+
+_index = NameIndex()
+_lock = threading.Lock()
+
+
+def _load_names(after_rowid):
+    return [name for (name,) in db.session.query(Card.name).filter(_rowid > after_rowid).distinct() if name]
+
+
+def refresh_name_index():
+    """Bring the index up to date with the catalog; cheap when nothing changed"""
+    global _index
+    version = get_catalog_version()
+    if version == _index.version:
+        return _index
+    with _lock:
+        if version == _index.version:
+            return _index
+        started = time.perf_counter()
+        index = _index
+        max_rowid = db.session.query(func.max(_rowid)).select_from(Card).scalar() or 0
+        rewritten = get_meta("cards_rewritten")
+        if max_rowid < index.last_rowid or rewritten != index.rewritten:
+            index = NameIndex()
+            index.rewritten = rewritten
+        added = index.add(_load_names(index.last_rowid))
+        index.last_rowid = max_rowid
+        index.version = version
+        _index = index
+        if added:
+            logging.info(
+                f"Name index: {added} new names, {len(index.names)} total "
+                f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+            )
+    return _index
+
+
+def reset_name_index():
+    """Drop the index so the next refresh rebuilds it (rowids may have been renumbered)"""
+    global _index
+    with _lock:
+        _index = NameIndex()
+
+
+def autocomplete(query, limit=10):
+    return refresh_name_index().search(query, min(limit, MAX_RESULTS))
@@ -0,0 +1,63 @@
+import time
+import uuid
+from datetime import datetime, timezone
+
+from ..models import db, CatalogMeta
+
+
+def get_meta(key, default=None):
+    entry = db.session.get(CatalogMeta, key)
+    return entry.value if entry else default
+
+
+def set_meta(key, value):
+    """Store a catalog-wide setting; the caller commits"""
+    entry = db.session.get(CatalogMeta, key)
+    if entry:
+        entry.value = value
+    else:
+        db.session.add(CatalogMeta(key=key, value=value))
+
+
+def mark_bulk_imported(source):
+    set_meta("bulk_imported_at", datetime.now(timezone.utc).isoformat())
+    set_meta("bulk_source", source)
+    db.session.commit()
+
+
+def catalog_is_bulk_loaded():
+    """True once a full Scryfall bulk import has populated the database"""
+    return get_meta("bulk_imported_at") is not None
+
+
+# Processes cache data derived from the catalog (printings, rendered pages,
+# ...) keyed on this stamp. Anything that changes cards bumps it, so caches
+# in every worker notice within CATALOG_VERSION_TTL seconds.
+CATALOG_VERSION_TTL = 1.0
+_version_cache = {"value": None, "checked_at": 0.0}
+
+
+def bump_catalog_version():
+    """Mark the card data as changed; the caller commits"""
+    set_meta("catalog_version", uuid.uuid4().hex)
+    _version_cache["checked_at"] = 0.0
+
+
+def mark_cards_rewritten():
+    """Record that existing card rows were overwritten (names may have
+    changed), so indexes that only pick up new rows rebuild; the caller commits"""
+    set_meta("cards_rewritten", uuid.uuid4().hex)
+
+
+def expire_catalog_version():
+    """Re-read the stamp on next use (the database file itself was swapped)"""
+    _version_cache["checked_at"] = 0.0
+
+
+def get_catalog_version():
+    """Current data-version stamp, re-read from the database at most once per TTL"""
+    now = time.monotonic()
+    if _version_cache["value"] is None or now - _version_cache["checked_at"] > CATALOG_VERSION_TTL:
+        _version_cache["value"] = get_meta("catalog_version", "0")
+        _version_cache["checked_at"] = now
+    return _version_cache["value"]
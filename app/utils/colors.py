@@ -0,0 +1,72 @@
+"""Colors packed into integer bitmasks.
+
+Bits 0-4 are W, U, B, R, G; bit 5 marks a colorless card so that "no
+colors" is a value of its own. With only 33 possible masks, any color
+predicate can be evaluated against every mask up front and turned into
+an indexable `color_mask IN (...)` filter.
+"""
+import re
+
+COLOR_BITS = {"W": 1, "U": 2, "B": 4, "R": 8, "G": 16}
+WUBRG = 31
+COLORLESS = 32
+
+# Every value a mask column can hold
+ALL_MASKS = [COLORLESS] + list(range(1, WUBRG + 1))
+
+_SYMBOL_RE = re.compile(r"\{([^}]*)\}")
+
+
+def color_mask(colors):
+    """Mask for a list of color letters such as ['W', 'U']"""
+    mask = 0
+    for color in colors or []:
+        mask |= COLOR_BITS.get(color, 0)
+    return mask or COLORLESS
+
+
+def mask_colors(mask):
+    """Color letters in WUBRG order for a mask; [] for colorless (or unknown)"""
+    return [color for color, bit in COLOR_BITS.items() if (mask or 0) & bit]
+
+
+def identity_from_text(*texts):
+    """Color letters in the mana symbols of a mana cost or rules text"""
+    letters = set()
+    for text in texts:
+        for symbol in _SYMBOL_RE.findall(text or ""):
+            letters.update(part for part in symbol.upper().split("/") if part in COLOR_BITS)
+    return letters
+
+
+def masks_matching(op, colors):
+    """All masks that satisfy `<mask> op colors`, Scryfall style.
+
+    ':' and '>=' mean "has at least these colors", '<=' "has no colors
+    outside these" (colorless included), '=' exactly these.
+    """
+    wanted = color_mask(colors) & WUBRG
+
+    def exact(mask):
+        return mask == COLORLESS if not wanted else mask == wanted
+
+    def superset(mask):
+        return exact(mask) if not wanted else (mask & wanted) == wanted
+
+    def subset(mask):
+        return (mask & WUBRG & ~wanted) == 0
+
+    tests = {
+        ":": superset,
+        ">=": superset,
+        "=": exact,
+        "!=": lambda mask: not exact(mask),
+        "<=": subset,
+        "<": lambda mask: subset(mask) and not exact(mask),
+        ">": lambda mask: superset(mask) and not exact(mask),
+    }
+    return [mask for mask in ALL_MASKS if tests[op](mask)]
+
+
+def multicolored_masks():
+    return [mask for mask in ALL_MASKS if bin(mask & WUBRG).count("1") >= 2]
@@ -0,0 +1,253 @@
+"""Decklist parsing and batched card resolution.
+
+Accepts the usual export formats, one card per line:
+
+    4 Lightning Bolt
+    4x Lightning Bolt (M11) 146
+    SB: 2 Duress
+    Sideboard            <- section headers switch the board
+    1 Delver of Secrets  <- front face of a double-faced card
+
+A whole list resolves with one IN query on Card.name; lines it misses
+(other capitalisation, front-face names) take a second query, and
+anything still missing is fetched from Scryfall's /cards/collection
+endpoint, 75 identifiers per request, and ingested.
+"""
+import logging
+import re
+import time
+from collections import namedtuple
+
+import requests
+from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.sqlite import insert
+
+from ..models import db, Card, Deck, DeckCard, SavedCard
+from .assets import get_http_session, scryfall_rate_limiter
+from .catalog import catalog_is_bulk_loaded
+from .http_cache import api_url
+from .importer import ingest_scryfall_cards
+from .query import escape_like
+from .storage import run_write
+
+COLLECTION_BATCH_SIZE = 75  # Scryfall's limit per /cards/collection request
+MAX_LINES = 500
+
+DeckLine = namedtuple("DeckLine", "number quantity name set_code collector_number board")
+# The printing columns a resolved line needs; full Card rows aren't loaded
+Printing = namedtuple("Printing", "id name set_code collector_number lang released_at")
+
+LINE_RE = re.compile(
+    r"^(?:SB:\s*)?"
+    r"(?:(?P<quantity>\d+)\s*[xX]?\s+)?"
+    r"(?P<name>.+?)"
+    r"(?:\s+\((?P<set>[A-Za-z0-9]{2,6})\)(?:\s+(?P<number>[^\s*]+))?)?"
+    r"(?:\s+\*[A-Z]+\*)*\s*$"
+)
+SECTIONS = {
+    "deck": "main", "main": "main", "mainboard": "main", "maindeck": "main",
+    "sideboard": "sideboard", "commander": "commander", "companion": "companion",
+    "maybeboard": "maybeboard",
+}
+
+
+class DecklistError(ValueError):
+    """The submitted text isn't a usable decklist"""
+
+
+def parse_decklist(text):
+    """DeckLine per card line; blank lines, comments and headers are skipped"""
+    lines = []
+    board = "main"
+    for number, raw in enumerate((text or "").splitlines(), 1):
+        line = raw.strip()
+        if not line or line.startswith(("#", "//")):
+            continue
+        section = SECTIONS.get(line.rstrip(":").strip().lower())
+        if section:
+            board = section
+            continue
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        lines.append(DeckLine(
+            number,
+            int(match.group("quantity") or 1),
+            match.group("name").strip(),
+            (match.group("set") or "").lower() or None,
+            match.group("number"),
+            "sideboard" if line.upper().startswith("SB:") else board,
+        ))
+        if len(lines) > MAX_LINES:
+            raise DecklistError(f"Decklists are limited to {MAX_LINES} lines")
+    return lines
+
+
+def _choose(line, printings):
+    """The printing the line asks for, or the newest English one"""
+    if line.set_code:
+        in_set = [p for p in printings if p.set_code == line.set_code]
+        if line.collector_number:
+            in_set = [p for p in in_set if p.collector_number == line.collector_number]
+        if in_set:
+            return in_set[0]
+        return None
+    english = [p for p in printings if p.lang == "en"] or printings
+    return max(english, key=lambda p: (p.released_at or "", p.id))
+
+
+def _query_printings(condition):
+    columns = (Card.id, Card.name, Card.set_code, Card.collector_number, Card.lang, Card.released_at)
+    return [Printing(*row) for row in db.session.query(*columns).filter(condition)]
+
+
+def _resolve_locally(lines, resolved):
+    """Fill resolved[i] for the lines found in the database; at most two queries"""
+    pending = [i for i in range(len(lines)) if resolved[i] is None]
+    if not pending:
+        return
+
+    by_name = {}
+    for printing in _query_printings(Card.name.in_({lines[i].name for i in pending})):
+        by_name.setdefault(printing.name, []).append(printing)
+    for i in pending:
+        if lines[i].name in by_name:
+            resolved[i] = _choose(lines[i], by_name[lines[i].name])
+
+    pending = [i for i in pending if resolved[i] is None and lines[i].name not in by_name]
+    if not pending:
+        return
+    # Other capitalisation, or the front face of "Front // Back"
+    names = {lines[i].name.lower() for i in pending}
+    conditions = [func.lower(Card.name).in_(names)]
+    conditions += [Card.name.like(escape_like(name) + " // %", escape="\\") for name in names]
+    by_key = {}
+    for printing in _query_printings(or_(*conditions)):
+        by_key.setdefault(printing.name.lower(), []).append(printing)
+        front = printing.name.split(" // ")[0].lower()
+        if front != printing.name.lower():
+            by_key.setdefault(front, []).append(printing)
+    for i in pending:
+        printings = by_key.get(lines[i].name.lower())
+        if printings:
+            resolved[i] = _choose(lines[i], printings)
+
+
+def _identifier(line):
+    if line.set_code and line.collector_number:
+        return {"set": line.set_code, "collector_number": line.collector_number}
+    if line.set_code:
+        return {"name": line.name, "set": line.set_code}
+    return {"name": line.name}
+
+
+def fetch_collection(identifiers):
+    """Card objects for identifiers from /cards/collection, 75 per request"""
+    cards = []
+    url = api_url("/cards/collection")
+    for start in range(0, len(identifiers), COLLECTION_BATCH_SIZE):
+        batch = identifiers[start:start + COLLECTION_BATCH_SIZE]
+        scryfall_rate_limiter.wait()
+        try:
+            response = get_http_session().post(
+                url, json={"identifiers": batch}, timeout=current_app.config["UPSTREAM_TIMEOUT"]
+            )
+        except requests.RequestException as e:
+            logging.warning(f"Scryfall collection fetch failed: {e}")
+            break
+        if response.status_code != 200:
+            logging.warning(f"Scryfall collection fetch failed: {response.status_code}")
+            break
+        data = response.json()
+        cards.extend(data.get("data", []))
+        if data.get("not_found"):
+            logging.info(f"Scryfall has no match for {len(data['not_found'])} decklist entries")
+    return cards
+
+
+def resolve_decklist(lines):
+    """Printing (or None) for each line, in order"""
+    resolved = [None] * len(lines)
+    _resolve_locally(lines, resolved)
+
+    missing = [i for i in range(len(lines)) if resolved[i] is None]
+    if missing and current_app.config["SCRYFALL_FALLBACK"] and not catalog_is_bulk_loaded():
+        identifiers = []
+        for i in missing:
+            identifier = _identifier(lines[i])
+            if identifier not in identifiers:
+                identifiers.append(identifier)
+        cards = fetch_collection(identifiers)
+        if cards:
+            run_write(ingest_scryfall_cards, cards)
+            # Set + number lookups are answered whatever name the line used
+            by_number = {
+                (card["set"], card["collector_number"]): Printing(
+                    card["id"], card["name"], card["set"], card["collector_number"],
+                    card.get("lang"), card.get("released_at"),
+                )
+                for card in cards
+            }
+            for i in missing:
+                resolved[i] = by_number.get((lines[i].set_code, lines[i].collector_number))
+            _resolve_locally(lines, resolved)
+
+    # Pinned to a printing nobody has: any printing of the card will do
+    pinned = [i for i in range(len(lines)) if resolved[i] is None and lines[i].set_code]
+    if pinned:
+        unpinned = [lines[i]._replace(set_code=None, collector_number=None) for i in pinned]
+        fallback = [None] * len(pinned)
+        _resolve_locally(unpinned, fallback)
+        for i, printing in zip(pinned, fallback):
+            resolved[i] = printing
+    return resolved
+
+
+def _add_saved_cards(quantities):
+    stmt = insert(SavedCard)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SavedCard.card_id],
+        set_={"quantity": SavedCard.quantity + stmt.excluded.quantity},
+    )
+    now = time.time()
+    db.session.execute(stmt, [
+        {"card_id": card_id, "quantity": quantity, "added_at": now} for card_id, quantity in quantities.items()
+    ])
+
+
+def save_cards(quantities):
+    """Add {card_id: quantity} to the saved collection"""
+    if quantities:
+        run_write(_add_saved_cards, quantities)
+
+
+def _remove_saved_card(card_id):
+    db.session.query(SavedCard).filter_by(card_id=card_id).delete()
+
+
+def remove_saved_card(card_id):
+    run_write(_remove_saved_card, card_id)
+
+
+def _create_deck(name, rows):
+    deck = Deck(name=name, created_at=time.time())
+    db.session.add(deck)
+    db.session.flush()
+    if rows:
+        db.session.execute(insert(DeckCard), [dict(row, deck_id=deck.id) for row in rows])
+    return deck.id
+
+
+def create_deck(name, lines, resolved):
+    """Store the resolved lines as a deck; returns its id"""
+    quantities = {}
+    for line, printing in zip(lines, resolved):
+        if printing:
+            key = (printing.id, line.board)
+            quantities[key] = quantities.get(key, 0) + line.quantity
+    rows = [
+        {"card_id": card_id, "board": board, "quantity": quantity}
+        for (card_id, board), quantity in quantities.items()
+    ]
+    return run_write(_create_deck, name, rows)
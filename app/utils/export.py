@@ -0,0 +1,162 @@
+"""Card search for machines: column projections, cursors and NDJSON export.
+
+/api/cards/search and /api/sets/<code>/cards select only the columns named
+in fields= as plain rows (no Card objects, no lazy relationship loads)
+and page with the same keyset cursors as the HTML pages. With
+format=ndjson the whole result is streamed one card per line, fetched
+EXPORT_CHUNK_SIZE rows at a time, so memory stays flat however many
+cards match.
+
+Only the local catalog is searched; nothing is fetched from Scryfall.
+"""
+import json
+from collections import namedtuple
+
+from sqlalchemy import func, literal_column, select
+
+from ..models import db, Card, Set
+from .colors import mask_colors
+from .pagination import decode_cursor, encode_cursor, seek_after
+from .query import compile_query
+from .search import fts_ranked_subquery
+
+DEFAULT_FIELDS = ("id", "name", "set_code", "collector_number", "mana_cost", "type_line", "rarity")
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _json_or_none(value):
+    return json.loads(value) if value else None
+
+
+# field name -> (column, converter applied to non-null values)
+FIELDS = {
+    "id": (Card.id, None),
+    "oracle_id": (Card.oracle_id, None),
+    "name": (Card.name, None),
+    "layout": (Card.layout, None),
+    "mana_cost": (Card.mana_cost, None),
+    "cmc": (Card.cmc, None),
+    "type_line": (Card.type_line, None),
+    "oracle_text": (Card.oracle_text, None),
+    "power": (Card.power, None),
+    "toughness": (Card.toughness, None),
+    "loyalty": (Card.loyalty, None),
+    "colors": (Card.color_mask, mask_colors),
+    "color_identity": (Card.color_identity_mask, mask_colors),
+    "rarity": (Card.rarity, None),
+    "collector_number": (Card.collector_number, None),
+    "set_code": (Card.set_code, None),
+    "set_name": (Set.name, None),
+    "lang": (Card.lang, None),
+    "released_at": (Card.released_at, None),
+    "image_uri": (Card.image_uri, None),
+    "local_image_path": (Card.local_image_path, None),
+    "thumb_image_path": (Card.thumb_image_path, None),
+    "scryfall_uri": (Card.scryfall_uri, None),
+    "rulings_uri": (Card.rulings_uri, None),
+    "prints_search_uri": (Card.prints_search_uri, None),
+    "legalities": (Card.legalities, _json_or_none),
+}
+
+# A query ready to page or stream; pages counts the pages served before it
+CardSelection = namedtuple("CardSelection", "statement sort_columns fields pages")
+
+
+def parse_fields(value):
+    """Field names from a comma-separated fields= value; "*" selects all of them"""
+    if not value:
+        return DEFAULT_FIELDS
+    if value.strip() == "*":
+        return tuple(FIELDS)
+    fields = []
+    for field in value.split(","):
+        field = field.strip()
+        if field not in FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+        if field not in fields:
+            fields.append(field)
+    return tuple(fields)
+
+
+def select_cards(fields, query_string=None, set_code=None, cursor=None):
+    """A CardSelection for a search, optionally within one set and after a cursor.
+
+    Raises QueryError for a bad query and ValueError for a bad cursor.
+    """
+    plan = compile_query(query_string or "")
+    conditions = []
+    if plan.where is not None:
+        conditions.append(plan.where)
+    if set_code:
+        conditions.append(Card.set_code == set_code)
+
+    columns = [FIELDS[field][0].label(field) for field in fields]
+    # (name, id) is unique, so it gives a stable order to seek through
+    sort_columns = [Card.name, Card.id]
+    ranked = fts_ranked_subquery(plan.rank_match) if plan.rank_match else None
+
+    if plan.unique == "cards":
+        # One printing per card: the one with the smallest id, an arbitrary but
+        # stable pick (the HTML search makes the same one), in name order
+        first_printings = select(func.min(Card.id)).where(*conditions).group_by(Card.oracle_id)
+        if ranked is not None:
+            first_printings = first_printings.join(ranked, literal_column("card.rowid") == ranked.c.rowid)
+        statement = select(*columns).select_from(Card).where(Card.id.in_(first_printings))
+    else:
+        statement = select(*columns).select_from(Card).where(*conditions)
+        if ranked is not None:
+            statement = statement.join(ranked, literal_column("card.rowid") == ranked.c.rowid)
+            sort_columns.insert(0, ranked.c.rank)
+    if "set_name" in fields:
+        statement = statement.outerjoin(Set, Set.code == Card.set_code)
+
+    # The sort key rides along after the projected columns, for the next cursor
+    statement = statement.add_columns(*sort_columns).order_by(*sort_columns)
+    pages = 0
+    if cursor:
+        after, pages = decode_cursor(cursor)
+        statement = seek_after(statement, sort_columns, after)
+    return CardSelection(statement, sort_columns, fields, pages)
+
+
+def _row_converter(selection):
+    """Function turning a result row into a card dict"""
+    fields = [(field, FIELDS[field][1]) for field in selection.fields]
+
+    def convert(row):
+        return {
+            field: converter(value) if converter and value is not None else value
+            for (field, converter), value in zip(fields, row)
+        }
+
+    return convert
+
+
+def fetch_cards_page(selection, limit=DEFAULT_PAGE_SIZE):
+    """One page of results as a Scryfall-style list object"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # One extra row tells whether there is a next page
+    rows = db.session.execute(selection.statement.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    convert = _row_converter(selection)
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(list(rows[-1][len(selection.fields):]), selection.pages + 1)
+    return {
+        "object": "list",
+        "data": [convert(row) for row in rows],
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    }
+
+
+def stream_cards(selection):
+    """Every matching card as NDJSON, one chunk of lines per batch of rows"""
+    convert = _row_converter(selection)
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    result = db.session.execute(selection.statement.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+    for rows in result.partitions():
+        yield "".join(encode(convert(row)) + "\n" for row in rows)
@@ -0,0 +1,154 @@
+"""Cache of rendered pages and grid fragments, with ETag revalidation.
+
+Keys start with the catalog version, so an import or ingest retires every
+entry at once; FRAGMENT_CACHE_TTL bounds how long a page can miss
+changes that don't bump the version (image and set icon downloads).
+Entries live in a byte-bounded LRU per process and, with
+FRAGMENT_CACHE_DIR set, in files shared by every worker.
+
+A hit is served without touching SQLAlchemy or Jinja (the catalog version
+is re-read at most once a second), and a matching If-None-Match gets a
+304 without a body.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, make_response, request
+
+from .catalog import get_catalog_version
+from .metrics import FRAGMENT_LOOKUPS
+
+Fragment = namedtuple("Fragment", "body etag created_at")
+
+
+def _etag(body):
+    return hashlib.sha1(body.encode("utf-8")).hexdigest()[:20]
+
+
+class FragmentCache:
+    def __init__(self, max_bytes, ttl, directory=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        self.entries = OrderedDict()  # key -> Fragment
+        self.size = 0
+        self.lock = threading.Lock()
+        self.disk_version = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, version):
+        return os.path.join(self.directory, f"{version}-{hashlib.sha1(key.encode('utf-8')).hexdigest()}.html")
+
+    def get(self, key, version):
+        now = time.time()
+        with self.lock:
+            fragment = self.entries.get(key)
+            if fragment and now - fragment.created_at < self.ttl:
+                self.entries.move_to_end(key)
+                return fragment
+        if not self.directory:
+            return None
+        path = self._path(key, version)
+        try:
+            created_at = os.path.getmtime(path)
+            if now - created_at >= self.ttl:
+                return None
+            with open(path, encoding="utf-8") as f:
+                body = f.read()
+        except OSError:
+            return None
+        fragment = Fragment(body, _etag(body), created_at)
+        self._remember(key, fragment)
+        return fragment
+
+    def put(self, key, version, body):
+        fragment = Fragment(body, _etag(body), time.time())
+        self._remember(key, fragment)
+        if self.directory:
+            self._write(key, version, body)
+        return fragment
+
+    def _remember(self, key, fragment):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.size -= len(old.body)
+            self.entries[key] = fragment
+            self.size += len(fragment.body)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def _write(self, key, version, body):
+        if version != self.disk_version:
+            self.disk_version = version
+            self._prune(version)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".fragment-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(body)
+            os.replace(temp_path, self._path(key, version))
+        except OSError as e:
+            logging.warning(f"Could not store page fragment: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _prune(self, version):
+        """Delete files written for older catalog versions"""
+        for name in os.listdir(self.directory):
+            if name.endswith(".html") and not name.startswith(f"{version}-"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+def get_fragment_cache(app):
+    cache = app.extensions.get("fragment_cache")
+    if cache is None:
+        cache = app.extensions["fragment_cache"] = FragmentCache(
+            app.config["FRAGMENT_CACHE_SIZE"],
+            app.config["FRAGMENT_CACHE_TTL"],
+            app.config["FRAGMENT_CACHE_DIR"],
+        )
+    return cache
+
+
+def cached_fragment(key_parts, render):
+    """The cached rendering for key_parts, calling render() to fill a miss"""
+    app = current_app._get_current_object()
+    if not app.config["FRAGMENT_CACHE"]:
+        return Fragment(render(), None, None)
+    cache = get_fragment_cache(app)
+    version = get_catalog_version()
+    key = "|".join(str(part) for part in (version,) + tuple(key_parts))
+    fragment = cache.get(key, version)
+    if fragment:
+        FRAGMENT_LOOKUPS.inc(result="hit")
+        return fragment
+    FRAGMENT_LOOKUPS.inc(result="miss")
+    return cache.put(key, version, render())
+
+
+def send_fragment(fragment, empty_status=None):
+    """Response for a cached fragment; 304 when the client already has it"""
+    if not fragment.body and empty_status:
+        return "", empty_status
+    response = make_response(fragment.body)
+    if fragment.etag:
+        response.set_etag(fragment.etag)
+        # Let browsers keep the page but check back, so updates show up
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+    return response
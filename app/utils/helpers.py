@@ -1,83 +1,119 @@
+import fcntl
 import os
 import requests
-import time
-import json
+import threading
 import logging
-
-from ..models import db, Card, Set, Color, card_colors, card_sets
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from ..models import db, Card, Set
+from .assets import download_file, queue_card_images, queue_set_icon
+from .catalog import bump_catalog_version, catalog_is_bulk_loaded, get_meta, set_meta
+from .http_cache import api_url, cached_get
+from .importer import ingest_scryfall_cards
+from .pagination import CardPage, decode_cursor, encode_cursor, seek_after
+from .printings import get_printings
+from .query import QueryError, compile_query
+from .search import fts_ranked_subquery
+from .storage import run_write
+from .symbology import get_mana_icons
+from .upstream import fetch_with_budget, prefetch, upstream_available
 from flask import current_app
+from sqlalchemy import insert, literal_column, update
 
 def fetch_and_cache_sets():
     try:
         logging.info("Fetching sets from Scryfall...")
-        response = requests.get("https://api.scryfall.com/sets")
+        response = cached_get(api_url("/sets"), ttl=0)
         if response.status_code == 200:
             data = response.json()
             sets = data.get("data", [])
+
+            # One query for every known set instead of a lookup per set
+            known_types = dict(db.session.query(Set.id, Set.set_type))
+            new_sets = []
+            typed_sets = []
             for set_data in sets:
-                existing_set = Set.query.get(set_data.get("id"))
-                if not existing_set:
-                    logging.debug(f"Processing set: {set_data['name']}")
-                    icon_url = set_data.get("icon_svg_uri")
-                    local_icon_path = None
-                    if icon_url:
-                        # Save to static/sets_icons/{set_code}.svg
-                        filename = f"{set_data.get('code')}.svg"
-                        save_dir = os.path.join(current_app.static_folder, "sets_icons")
-                        os.makedirs(save_dir, exist_ok=True)
-                        save_path = os.path.join(save_dir, filename)
-                        # Download the image
-                        try:
-                            img_response = requests.get(icon_url)
-                            if img_response.status_code == 200:
-                                with open(save_path, "wb") as f:
-                                    f.write(img_response.content)
-                                # Store the relative path for HTML rendering
-                                local_icon_path = f"sets_icons/{filename}"
-                        except Exception as img_e:
-                            logging.error(f"Failed to download icon for set {set_data.get('code')}: {img_e}")
-
-                    new_set = Set(
-                        id=set_data.get("id"),
-                        name=set_data.get("name"),
-                        code=set_data.get("code"),
-                        icon_url=icon_url,
-                        local_icon_path=local_icon_path,  # <-- Add this field to your model!
-                        released_at=set_data.get("released_at")
-                    )
-                    db.session.add(new_set)
-                    db.session.flush()
-            db.session.commit()
-            logging.info(f"Fetched and cached {len(sets)} sets.")
+                if set_data.get("id") in known_types:
+                    # Sets stored before set_type was recorded
+                    if known_types[set_data["id"]] is None and set_data.get("set_type"):
+                        typed_sets.append({"id": set_data["id"], "set_type": set_data["set_type"]})
+                    continue
+                logging.debug(f"Processing set: {set_data['name']}")
+                new_sets.append({
+                    "id": set_data.get("id"),
+                    "name": set_data.get("name"),
+                    "code": set_data.get("code"),
+                    "icon_url": set_data.get("icon_svg_uri"),
+                    "local_icon_path": None,  # Filled in once the icon download finishes
+                    "released_at": set_data.get("released_at"),
+                    "set_type": set_data.get("set_type"),
+                })
+            run_write(_store_sets, new_sets, typed_sets)
+            logging.info(f"Fetched {len(sets)} sets, {len(new_sets)} new.")
+
+            # Icons are saved to static/sets_icons/{set_code}.svg in the background
+            app = current_app._get_current_object()
+            for new_set in new_sets:
+                if new_set["icon_url"]:
+                    queue_set_icon(app, new_set["code"], new_set["icon_url"])
+            return len(new_sets)
         else:
             logging.error(f"Failed to fetch sets: {response.status_code}")
     except Exception as e:
         logging.error(f"Error fetching sets: {e}")
         db.session.rollback()
+    return None
+
+def _store_sets(new_sets, typed_sets=()):
+    if new_sets:
+        db.session.execute(insert(Set), new_sets)
+    if typed_sets:
+        db.session.execute(update(Set), typed_sets)
+    if new_sets or typed_sets:
+        bump_catalog_version()  # Cached set listings are keyed on it
+    set_meta("sets_synced_at", datetime.now(timezone.utc).isoformat())
+
+def _sets_sync_is_fresh(app):
+    synced_at = get_meta("sets_synced_at")
+    if not synced_at:
+        return False
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(synced_at)
+    return age.total_seconds() < app.config['SET_SYNC_INTERVAL']
+
+def sync_sets_locked(app, force=False):
+    """Run fetch_and_cache_sets under a per-volume file lock.
+
+    Without force this is the startup path: it returns straight away if
+    another process holds the lock or the sets were synced recently.
+    """
+    lock_path = os.path.join(os.path.dirname(app.config['DB_PATH']), ".sets-sync.lock")
+    with open(lock_path, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if force else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            logging.debug("Set sync already running in another process")
+            return None
+        with app.app_context():
+            if not force and _sets_sync_is_fresh(app):
+                logging.debug("Sets were synced recently, skipping")
+                return 0
+            return fetch_and_cache_sets()
+
+def start_background_set_sync(app):
+    """Sync the set list with Scryfall without delaying startup"""
+    thread = threading.Thread(target=sync_sets_locked, args=(app,), name="set-sync", daemon=True)
+    thread.start()
+    return thread
 
 def download_image(url, filename):
     logging.debug(f"Downloading image from {url} to {filename}")
-    if os.path.exists(filename):
-        logging.info(f"Image already exists at {filename}, skipping download.")
-        return True
-
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(filename, 'wb') as f:
-                f.write(response.content)
-            logging.info(f"Image downloaded and saved to {filename}")
-            return True
-        else:
-            logging.error(f"Failed to download image from {url}")
-            return False
-    except Exception as e:
-        logging.error(f"Error downloading image: {e}")
-        return False
+    return download_file(url, filename)
 
 def fetch_and_cache_cards(
     card_name=None,
     card_type=None,
+    card_format=None,
     selected_colors=None,
     selected_sets=None,
     search_string=None,
@@ -85,168 +121,177 @@ def fetch_and_cache_cards(
     page=1,          # Add page parameter
     per_page=20      # Add per_page parameter
 ):
+    """Return one page of cards as a list; see fetch_card_page"""
+    return fetch_card_page(
+        card_name=card_name,
+        card_type=card_type,
+        card_format=card_format,
+        selected_colors=selected_colors,
+        selected_sets=selected_sets,
+        search_string=search_string,
+        unique_cards=unique_cards,
+        page=page,
+        per_page=per_page,
+    ).cards
+
+def fetch_card_page(
+    card_name=None,
+    card_type=None,
+    card_format=None,
+    selected_colors=None,
+    selected_sets=None,
+    search_string=None,
+    unique_cards=False,
+    page=1,
+    per_page=20,
+    cursor=None
+):
+    """Search the local catalog and return a CardPage.
+
+    Pages are addressed by the opaque cursor from the previous page's
+    next_cursor (keyset pagination, so deep pages cost the same as the
+    first one). Without a cursor the legacy page number is used.
+    Raises ValueError for a malformed cursor and QueryError for a bad query.
+    """
+    after = None
+    if cursor:
+        after, pages_served = decode_cursor(cursor)
+        page = pages_served + 1
+
     try:
-        # Build query parts (same as before)
-        query_parts = []
+        # Build a Scryfall query string; it is compiled locally and sent upstream as-is
+        # The unique: default goes first so one typed into the search box wins
+        query_parts = ["unique:cards" if unique_cards else "unique:prints"]
         if card_name:
             query_parts.append(f'!"{card_name}"')
         if card_type:
-            query_parts.append(f't:{card_type}')
+            query_parts.append(f't:"{card_type}"')
+        if card_format:
+            query_parts.append(f'f:{card_format}')
         if selected_colors:
             query_parts.append(" ".join([f'c:{color}' for color in selected_colors]))
         if selected_sets:
-            query_parts.append(" ".join([f's:{set_code}' for set_code in selected_sets]))
+            query_parts.append("(" + " or ".join([f's:{set_code}' for set_code in selected_sets]) + ")")
         if search_string:
-            query_parts.append(f'"{search_string}"')
-        if unique_cards:
-            query_parts.append("unique:prints")
+            query_parts.append(f'({search_string})')
 
         query = " ".join(query_parts)
         logging.info(f"Search Query: {query}, Page: {page}")
 
         # Build the base database query
+        plan = compile_query(query)
         db_query = Card.query
-        if card_name:
-            db_query = db_query.filter(Card.name == card_name)
-        if card_type:
-            db_query = db_query.filter(Card.type_line.ilike(f"%{card_type}%"))
-        if selected_colors:
-            db_query = db_query.join(card_colors).join(Color).filter(Color.name.in_(selected_colors))
-        if selected_sets:
-            db_query = db_query.filter(Card.set.has(Set.code.in_(selected_sets)))
-        if search_string:
-            db_query = db_query.filter(Card.name.ilike(f"%{search_string}%"))
+        if plan.where is not None:
+            db_query = db_query.filter(plan.where)
+
+        # Text terms go through the FTS5 index and are ranked with bm25
+        ranked = None
+        if plan.rank_match:
+            ranked = fts_ranked_subquery(plan.rank_match)
+            db_query = db_query.join(ranked, literal_column("card.rowid") == ranked.c.rowid)
 
         # Handle unique cards
-        if unique_cards:
+        if plan.unique == "cards":
             subquery = db_query.with_entities(
                 Card.oracle_id,
                 db.func.min(Card.id).label('min_id')
             ).group_by(Card.oracle_id).subquery()
             db_query = Card.query.join(subquery, Card.id == subquery.c.min_id)
+            ranked = None
+
+        # (name, id) is unique, so it gives a stable order to seek through
+        sort_columns = [Card.name, Card.id]
+        if ranked is not None:
+            sort_columns.insert(0, ranked.c.rank)
+            db_query = db_query.add_columns(ranked.c.rank)
+        db_query = db_query.order_by(*sort_columns)
+
+        def load_page():
+            page_query = db_query
+            if after is not None:
+                page_query = seek_after(page_query, sort_columns, after)
+            elif page > 1:
+                page_query = page_query.offset((page - 1) * per_page)
+            rows = page_query.limit(per_page).all()
+            if ranked is None:
+                cards = rows
+                next_cursor = _next_cursor(rows, page, per_page, lambda card: [card.name, card.id])
+            else:
+                cards = [card for card, _ in rows]
+                next_cursor = _next_cursor(rows, page, per_page, lambda row: [row[1], row[0].name, row[0].id])
+            # Local image copies fill in after the response; templates use image_uri until then
+            queue_card_images(current_app._get_current_object(), cards)
+            return CardPage(cards, next_cursor)
 
         # Apply pagination to database query
-        paginated_cards = db_query.order_by(Card.name).offset((page - 1) * per_page).limit(per_page).all()
+        result = load_page()
 
         # If we have enough cards for this page, return them
-        if len(paginated_cards) == per_page:
-            return paginated_cards
-
-        # If we need to fetch from Scryfall
-        url = f"https://api.scryfall.com/cards/search"
-        params = {
-            'q': query or 'set:default',
-            'page': page
-        }
-
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            logging.warning(f"Scryfall fetch failed: {response.status_code}")
-            return paginated_cards
-
-        data = response.json()
-        new_cards = []
-
-        for card_data in data.get("data", []):
-            # Skip if card exists
-            if Card.query.get(card_data["id"]):
-                continue
-
-            # Process image
-            image_url = card_data.get("image_uris", {}).get("normal")
-            local_image_path = None
-            if image_url:
-                filename = f"{card_data['id']}.jpg"
-                save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-
-                if download_image(image_url, save_path):
-                    local_image_path = os.path.join(
-                        current_app.config['IMAGE_PATH'],
-                        filename
-                    )
-
-            # Process colors
-            colors = []
-            for color_name in card_data.get("colors", []):
-                color = Color.query.filter_by(name=color_name).first()
-                if not color:
-                    color_id = f"color_{color_name}"
-                    color = Color(id=color_id, name=color_name)
-                    db.session.add(color)
-                colors.append(color)
-
-            # Get or create set
-            card_set = None
-            if 'set' in card_data:
-                card_set = Set.query.filter_by(code=card_data['set']).first()
-
-            # Create new card
-            new_card = Card(
-                id=card_data["id"],
-                oracle_id=card_data.get("oracle_id"),
-                name=card_data["name"],
-                type_line=card_data.get("type_line"),
-                mana_costs=card_data.get("mana_cost"),
-                oracle_text=card_data.get("oracle_text"),
-                power=card_data.get("power"),
-                toughness=card_data.get("toughness"),
-                rarity=card_data.get("rarity"),
-                image_uri=image_url,
-                local_image_path=local_image_path,
-                legalities=json.dumps(card_data.get("legalities", {}))
-            )
-
-            new_card.colors = colors
-            if card_set:
-                new_card.set = card_set
-
-            db.session.add(new_card)
-            new_cards.append(new_card)
-
-        if new_cards:
-            try:
-                db.session.commit()
-            except Exception as e:
-                logging.error(f"Error committing to database: {e}")
-                db.session.rollback()
-                return paginated_cards
+        if len(result.cards) == per_page:
+            return result
+
+        # The local catalog is authoritative once a bulk import has loaded it
+        app = current_app._get_current_object()
+        if not app.config['SCRYFALL_FALLBACK'] or catalog_is_bulk_loaded():
+            return result
+        if not upstream_available(urlsplit(app.config['SCRYFALL_API_URL']).hostname):
+            return result
+
+        # Fetch from Scryfall on the upstream pool; if it is slow the local
+        # results go out now and the page is stored for the next request
+        fetched = fetch_with_budget(app, ("search", query, page), _fetch_scryfall_page, query, page)
+        if not fetched:
+            return result
+
+        # Infinite scroll asks for the next page soon; have it ready
+        if fetched.get("has_more"):
+            prefetch(app, ("search", query, page + 1), _fetch_scryfall_page, query, page + 1)
 
         # Query again with pagination to get the complete set
-        final_cards = db_query.order_by(Card.name).offset((page - 1) * per_page).limit(per_page).all()
-
-        # If no cards found for this page, return empty list to signal end of results
-        if not final_cards:
-            return []
-
-        return final_cards
+        return load_page()
 
+    except QueryError:
+        raise
     except Exception as e:
-        logging.error(f"Error in fetch_and_cache_cards: {e}")
+        logging.error(f"Error in fetch_card_page: {e}")
         db.session.rollback()
-        return []
+        return CardPage([], None)
+
+def _fetch_scryfall_page(query, page):
+    """Fetch one Scryfall search page and store its cards; the response data, or None"""
+    url = api_url("/cards/search")
+    params = {
+        'q': query or 'set:default',
+        'page': page
+    }
+
+    try:
+        response = cached_get(url, params=params)
+    except requests.RequestException as e:
+        logging.warning(f"Scryfall fetch failed: {e}")
+        return None
+    if response.status_code != 200:
+        logging.warning(f"Scryfall fetch failed: {response.status_code}")
+        return None
+
+    # Store the whole page in one batched transaction on the writer thread
+    data = response.json()
+    try:
+        run_write(ingest_scryfall_cards, data.get("data", []))
+    except Exception as e:
+        logging.error(f"Error committing to database: {e}")
+        return None
+    return data
+
+def _next_cursor(rows, page, per_page, sort_key):
+    """Cursor continuing after the last row, or None when this was the last page"""
+    if len(rows) < per_page:
+        return None
+    return encode_cursor(sort_key(rows[-1]), page)
 
 def fetch_and_cache_mana_icons():
-    response = requests.get("https://api.scryfall.com/symbology")
-    mana_icons = {}
-    if response.status_code == 200:
-        data = response.json()
-        os.makedirs("static/mana", exist_ok=True)
-        for symbol in data.get("data", []):
-            symbol_code = symbol["symbol"]  # e.g. "{R}", "{2}"
-            svg_url = symbol["svg_uri"]
-            # Clean the symbol for filename, e.g. {R} -> R, {2} -> 2, {W/U} -> WU, etc.
-            filename = symbol_code.replace("{", "").replace("}", "").replace("/", "").replace(" ", "") + ".svg"
-            local_path = os.path.join("static", "mana", filename)
-            # Download and cache if not already present
-            if not os.path.exists(local_path):
-                img_response = requests.get(svg_url)
-                if img_response.status_code == 200:
-                    with open(local_path, "wb") as f:
-                        f.write(img_response.content)
-                    time.sleep(0.05)  # 50ms delay
-            # Store the relative path for use in templates
-            mana_icons[symbol_code] = f"mana/{filename}"
-    return mana_icons
+    """Mana symbol -> icon path map, served from the in-process symbology cache"""
+    return get_mana_icons(current_app._get_current_object())
 
 def card_to_dict(card):
     """Convert a single card to dictionary"""
@@ -293,10 +338,5 @@ def card_to_dict(card):
     }
 
 def fetch_reprints(card):
-    """Fetch reprints and convert them to dictionaries"""
-    if not card.oracle_id:
-        return []
-
-    reprints = fetch_and_cache_cards(card_name=card.name, unique_cards=False)
-    # Convert each reprint to a dictionary
-    return [card_to_dict(reprint) for reprint in reprints]
\ No newline at end of file
+    """Other printings of a card, served from the local oracle_id index"""
+    return get_printings(card.oracle_id)
@@ -0,0 +1,144 @@
+"""Persistent cache for Scryfall API responses.
+
+Responses are stored in the http_cache table keyed by URL and query
+parameters. Fresh entries are served without a request; stale ones are
+revalidated with If-None-Match / If-Modified-Since, and served as-is if
+Scryfall can't be reached. Concurrent identical requests in a process
+share one outbound fetch.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert
+
+from ..models import db, HttpCacheEntry
+from .assets import get_http_session, scryfall_rate_limiter
+from .storage import queue_write
+
+# Statuses worth remembering; 404 is Scryfall's "no cards matched"
+CACHEABLE_STATUSES = (200, 404)
+FOLLOWER_TIMEOUT = 120
+
+
+class CachedResponse:
+    """The parts of requests.Response the helpers use"""
+
+    def __init__(self, status_code, body, content_type=None, from_cache=False):
+        self.status_code = status_code
+        self.content = body or b""
+        self.headers = {"Content-Type": content_type} if content_type else {}
+        self.from_cache = from_cache
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def cache_key(url, params=None):
+    full_url = url + ("?" + urlencode(sorted(params.items())) if params else "")
+    return hashlib.sha1(full_url.encode("utf-8")).hexdigest(), full_url
+
+
+def api_url(path):
+    return current_app.config["SCRYFALL_API_URL"].rstrip("/") + path
+
+
+def cached_get(url, params=None, ttl=None):
+    """GET through the response cache; identical in-flight calls share one fetch"""
+    key, full_url = cache_key(url, params)
+
+    with _inflight_lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+
+    if not leader:
+        if not call.done.wait(FOLLOWER_TIMEOUT):
+            raise requests.Timeout(f"Timed out waiting for shared fetch of {full_url}")
+        if call.error:
+            raise call.error
+        return call.response
+
+    try:
+        call.response = _fetch(key, full_url, url, params, ttl)
+        return call.response
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        call.done.set()
+
+
+def _store_entry(values):
+    stmt = insert(HttpCacheEntry).values(values)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=["key"], set_=values))
+
+
+def _touch_entry(key, fetched_at):
+    db.session.query(HttpCacheEntry).filter_by(key=key).update({"fetched_at": fetched_at})
+
+
+def _fetch(key, full_url, url, params, ttl):
+    if ttl is None:
+        ttl = current_app.config["SCRYFALL_CACHE_TTL"]
+    entry = db.session.get(HttpCacheEntry, key)
+    now = time.time()
+    if entry and now - entry.fetched_at < ttl:
+        return CachedResponse(entry.status_code, entry.body, entry.content_type, from_cache=True)
+
+    headers = {"Accept": "application/json"}
+    if entry and entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry and entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+
+    scryfall_rate_limiter.wait()
+    try:
+        response = get_http_session().get(
+            url, params=params, headers=headers, timeout=current_app.config["UPSTREAM_TIMEOUT"]
+        )
+    except requests.RequestException as e:
+        if entry:
+            logging.warning(f"Serving stale cache for {full_url}: {e}")
+            return CachedResponse(entry.status_code, entry.body, entry.content_type, from_cache=True)
+        raise
+
+    if response.status_code == 304 and entry:
+        queue_write(_touch_entry, key, now)
+        return CachedResponse(entry.status_code, entry.body, entry.content_type, from_cache=True)
+
+    if response.status_code in CACHEABLE_STATUSES:
+        queue_write(_store_entry, {
+            "key": key,
+            "url": full_url,
+            "status_code": response.status_code,
+            "content_type": response.headers.get("Content-Type"),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body": response.content,
+            "fetched_at": now,
+        })
+    elif entry and response.status_code >= 500:
+        logging.warning(f"Serving stale cache for {full_url}: upstream returned {response.status_code}")
+        return CachedResponse(entry.status_code, entry.body, entry.content_type, from_cache=True)
+
+    return CachedResponse(response.status_code, response.content, response.headers.get("Content-Type"))
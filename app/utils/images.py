@@ -0,0 +1,139 @@
+"""Resized derivatives of downloaded card images.
+
+Scryfall's `normal` JPEG is 488px wide and far larger than a grid tile
+needs. After a card image is downloaded, a grid thumbnail and a
+detail-size copy are written next to it as WebP (JPEG if this Pillow
+build can't encode WebP). Their filenames carry a hash of the file
+contents, so they never change once written and can be cached forever.
+
+Pillow is optional; without it only the original JPEG is served.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from sqlalchemy import bindparam, update
+
+from ..models import db, Card
+
+try:
+    from PIL import Image, features
+except ImportError:  # pragma: no cover - depends on the install
+    Image = None
+
+# Variant name -> target width in pixels. Scryfall card images are 488x680.
+VARIANTS = {"thumb": 244, "detail": 488}
+QUALITY = 80
+
+DERIVED_DIR = "derived"  # Under UPLOAD_FOLDER / IMAGE_PATH
+
+
+def derivatives_supported():
+    return Image is not None
+
+
+def _output_format():
+    return ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+
+
+def _encode(image, width):
+    if image.width > width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), Image.LANCZOS)
+    fmt, extension = _output_format()
+    buffer = BytesIO()
+    if fmt == "WEBP":
+        image.save(buffer, fmt, quality=QUALITY, method=4)
+    else:
+        image.save(buffer, fmt, quality=QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue(), extension
+
+
+def _write_atomic(data, save_path):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(save_path), suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, save_path)
+
+
+def make_derivatives(source_path, upload_folder, image_path, stem):
+    """Write every variant of source_path and return {variant: path for HTML}
+
+    Returns an empty dict if Pillow is missing or the source can't be read.
+    """
+    if Image is None:
+        return {}
+    out_dir = os.path.join(upload_folder, DERIVED_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        with Image.open(source_path) as image:
+            image = image.convert("RGB")
+            paths = {}
+            for variant, width in VARIANTS.items():
+                data, extension = _encode(image, width)
+                digest = hashlib.sha1(data).hexdigest()[:12]
+                filename = f"{stem}.{variant}.{digest}.{extension}"
+                save_path = os.path.join(out_dir, filename)
+                if not os.path.exists(save_path):
+                    _write_atomic(data, save_path)
+                paths[variant] = os.path.join(image_path, DERIVED_DIR, filename)
+            return paths
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not resize {source_path}: {e}")
+        return {}
+
+
+def derivative_columns(paths):
+    """Card column values for the result of make_derivatives"""
+    return {
+        "thumb_image_path": paths.get("thumb"),
+        "detail_image_path": paths.get("detail"),
+    }
+
+
+def backfill_derivatives(app, force=False, batch_size=500):
+    """Build derivatives for card images downloaded before they existed.
+
+    Resizing runs on ASSET_WORKERS threads (Pillow releases the GIL while
+    it works) and the new paths are written back in batches. Returns the
+    number of cards updated.
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+    query = db.session.query(Card.id, Card.local_image_path).filter(Card.local_image_path.isnot(None))
+    if not force:
+        query = query.filter(Card.thumb_image_path.is_(None))
+    pending = query.all()
+    db.session.rollback()  # Don't hold a read transaction while resizing
+
+    def resize(row):
+        card_id, local_path = row
+        source = os.path.join(app.config["UPLOAD_FOLDER"], os.path.basename(local_path))
+        return card_id, make_derivatives(source, app.config["UPLOAD_FOLDER"], app.config["IMAGE_PATH"], card_id)
+
+    card_table = Card.__table__
+    stmt = update(card_table).where(card_table.c.id == bindparam("card_id")).values(
+        thumb_image_path=bindparam("thumb"), detail_image_path=bindparam("detail")
+    )
+    updated = 0
+    batch = []
+    with ThreadPoolExecutor(max_workers=app.config["ASSET_WORKERS"]) as executor:
+        for card_id, paths in executor.map(resize, pending):
+            if not paths:
+                continue
+            batch.append({"card_id": card_id, "thumb": paths["thumb"], "detail": paths["detail"]})
+            if len(batch) >= batch_size:
+                db.session.execute(stmt, batch)
+                db.session.commit()
+                updated += len(batch)
+                logging.info(f"Resized {updated} card images...")
+                batch = []
+    if batch:
+        db.session.execute(stmt, batch)
+        db.session.commit()
+        updated += len(batch)
+    return updated
@@ -0,0 +1,320 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+import ijson
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from ..models import db, Card, Color, Type, card_colors, card_legalities, card_types
+from .catalog import bump_catalog_version, mark_bulk_imported, mark_cards_rewritten
+from .colors import color_mask
+from .sets import refresh_set_summaries
+
+# Columns refreshed when a card that already exists is imported again.
+# local_image_path is owned by the image cache and never comes from Scryfall.
+CARD_COLUMNS = [
+    "oracle_id", "name", "layout", "mana_cost", "cmc", "type_line",
+    "oracle_text", "power", "toughness", "loyalty", "rarity",
+    "collector_number", "set_code", "lang", "released_at", "mana_costs",
+    "image_uri", "scryfall_uri", "rulings_uri", "legalities",
+    "prints_search_uri", "content_hash", "color_mask", "color_identity_mask",
+]
+
+DEFAULT_BATCH_SIZE = 5000
+# Incremental syncs run next to live web workers, so keep each write
+# transaction (and the SQLite write lock) short.
+DEFAULT_SYNC_BATCH_SIZE = 1000
+
+
+def open_bulk_file(path):
+    """Open a Scryfall bulk data file, transparently handling .gz dumps"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_bulk_cards(fileobj):
+    """Stream card objects out of a bulk JSON array without loading it"""
+    return ijson.items(fileobj, "item", use_float=True)
+
+
+def _front_face(card_data):
+    faces = card_data.get("card_faces") or []
+    return faces[0] if faces else {}
+
+
+def _face_values(card_data, key):
+    """Collect a field from every face of a multi-faced card"""
+    faces = card_data.get("card_faces") or []
+    return [face.get(key) for face in faces if face.get(key)]
+
+
+def parse_type_names(type_line):
+    """Split a type line like 'Legendary Creature — Goblin' into type names"""
+    names = []
+    for face_line in (type_line or "").split("//"):
+        for word in face_line.replace("—", " ").split():
+            if word not in names:
+                names.append(word)
+    return names
+
+
+def card_row_from_scryfall(card_data):
+    """Map a Scryfall card object onto a row for the card table"""
+    front = _front_face(card_data)
+    image_uris = card_data.get("image_uris") or front.get("image_uris") or {}
+
+    mana_cost = card_data.get("mana_cost")
+    if not mana_cost:
+        mana_cost = " // ".join(_face_values(card_data, "mana_cost")) or None
+
+    oracle_text = card_data.get("oracle_text")
+    if oracle_text is None:
+        oracle_text = "\n//\n".join(_face_values(card_data, "oracle_text")) or None
+
+    cmc = card_data.get("cmc")
+    return {
+        "id": card_data["id"],
+        "oracle_id": card_data.get("oracle_id") or front.get("oracle_id"),
+        "name": card_data.get("name"),
+        "layout": card_data.get("layout"),
+        "mana_cost": mana_cost,
+        "cmc": float(cmc) if cmc is not None else None,
+        "type_line": card_data.get("type_line") or front.get("type_line"),
+        "oracle_text": oracle_text,
+        "power": card_data.get("power", front.get("power")),
+        "toughness": card_data.get("toughness", front.get("toughness")),
+        "loyalty": card_data.get("loyalty", front.get("loyalty")),
+        "rarity": card_data.get("rarity"),
+        "collector_number": card_data.get("collector_number"),
+        "set_code": card_data.get("set"),
+        "lang": card_data.get("lang"),
+        "released_at": card_data.get("released_at"),
+        "mana_costs": mana_cost,
+        "image_uri": image_uris.get("normal"),
+        "scryfall_uri": card_data.get("scryfall_uri"),
+        "rulings_uri": card_data.get("rulings_uri"),
+        "legalities": json.dumps(card_data.get("legalities", {})),
+        "prints_search_uri": card_data.get("prints_search_uri"),
+        "color_mask": color_mask(card_colors_from_scryfall(card_data)),
+        "color_identity_mask": color_mask(card_data.get("color_identity")),
+    }
+
+
+def card_colors_from_scryfall(card_data):
+    colors = card_data.get("colors")
+    if colors is None:
+        colors = []
+        for face_colors in _face_values(card_data, "colors"):
+            colors.extend(c for c in face_colors if c not in colors)
+    return colors
+
+
+def card_legalities_from_scryfall(card_data):
+    """(format, status) pairs for every format the card is not 'not_legal' in"""
+    legalities = card_data.get("legalities") or {}
+    return [(fmt, status) for fmt, status in legalities.items() if status != "not_legal"]
+
+
+def card_content_hash(row, colors, type_names):
+    """Fingerprint everything we store for a card so unchanged rows can be skipped"""
+    payload = json.dumps([row, sorted(colors), type_names], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class CardBatchWriter:
+    """Buffers mapped cards and writes them with executemany in one transaction per batch
+
+    In incremental mode each batch is first compared against the stored
+    content hashes and only new or changed cards are written. With
+    autocommit=False the caller owns the transaction (see storage.py).
+    With update_summaries the set summaries of each batch's sets are
+    recounted along with it; bulk imports recount once at the end instead.
+    only_new promises that none of the cards are in the database yet.
+    """
+
+    def __init__(self, session, batch_size=DEFAULT_BATCH_SIZE, incremental=False, autocommit=True,
+                 update_summaries=True, only_new=False):
+        self.session = session
+        self.only_new = only_new
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.autocommit = autocommit
+        self.update_summaries = update_summaries
+        self.cards = []
+        self.color_links = []
+        self.type_links = []
+        self.legality_rows = []
+        self.known_colors = {c.name for c in session.query(Color).all()}
+        self.known_types = {t.name for t in session.query(Type).all()}
+        self.written = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    def add(self, card_data):
+        row = card_row_from_scryfall(card_data)
+        colors = card_colors_from_scryfall(card_data)
+        type_names = parse_type_names(row["type_line"])
+        row["content_hash"] = card_content_hash(row, colors, type_names)
+
+        self.cards.append(row)
+        for color_name in colors:
+            self.color_links.append((row["id"], f"color_{color_name}", color_name))
+        for type_name in type_names:
+            self.type_links.append((row["id"], f"type_{type_name}", type_name))
+        for fmt, status in card_legalities_from_scryfall(card_data):
+            self.legality_rows.append({"card_id": row["id"], "format": fmt, "status": status})
+
+        if len(self.cards) >= self.batch_size:
+            self.flush()
+
+    def _write_links(self, links, model, known, table, column):
+        """Create any unseen Color/Type rows, then link them to the batch's cards"""
+        if not links:
+            return
+        new_rows = {name: {"id": lookup_id, "name": name} for _, lookup_id, name in links if name not in known}
+        if new_rows:
+            self.session.execute(sqlite_insert(model).on_conflict_do_nothing(), list(new_rows.values()))
+            known.update(new_rows)
+        self.session.execute(
+            insert(table).prefix_with("OR IGNORE"),
+            [{"card_id": card_id, column: lookup_id} for card_id, lookup_id, _ in links],
+        )
+
+    def _write_legalities(self, card_ids):
+        """Replace the legality rows of the batch's cards"""
+        self.session.execute(delete(card_legalities).where(card_legalities.c.card_id.in_(card_ids)))
+        if self.legality_rows:
+            self.session.execute(insert(card_legalities), self.legality_rows)
+
+    def _select_changed(self):
+        """Drop unchanged cards and their links from the batch"""
+        ids = [row["id"] for row in self.cards]
+        stored = dict(self.session.query(Card.id, Card.content_hash).filter(Card.id.in_(ids)))
+
+        changed = [row for row in self.cards if stored.get(row["id"], "") != row["content_hash"]]
+        updated_ids = [row["id"] for row in changed if row["id"] in stored]
+        self.inserted += len(changed) - len(updated_ids)
+        self.updated += len(updated_ids)
+        self.unchanged += len(self.cards) - len(changed)
+
+        changed_ids = {row["id"] for row in changed}
+        self.color_links = [link for link in self.color_links if link[0] in changed_ids]
+        self.type_links = [link for link in self.type_links if link[0] in changed_ids]
+        self.legality_rows = [row for row in self.legality_rows if row["card_id"] in changed_ids]
+        return changed
+
+    def flush(self):
+        if not self.cards:
+            return
+
+        batch_size = len(self.cards)
+        updated = self.updated
+        if self.incremental:
+            self.cards = self._select_changed()
+        if not self.cards:
+            # Nothing changed, don't even take the write lock
+            if self.autocommit:
+                self.session.rollback()
+            self.written += batch_size
+            self.color_links = []
+            self.type_links = []
+            self.legality_rows = []
+            return
+
+        stmt = sqlite_insert(Card)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Card.id],
+            set_={column: stmt.excluded[column] for column in CARD_COLUMNS},
+        )
+        # render_nulls keeps rows with missing fields in the same executemany
+        # batch; by default the ORM splits the batch per set of non-null keys
+        self.session.execute(stmt, self.cards, execution_options={"render_nulls": True})
+
+        # A re-imported card may have lost colors or types; replace its links
+        card_ids = [row["id"] for row in self.cards]
+        self.session.execute(delete(card_colors).where(card_colors.c.card_id.in_(card_ids)))
+        self.session.execute(delete(card_types).where(card_types.c.card_id.in_(card_ids)))
+        self._write_links(self.color_links, Color, self.known_colors, card_colors, "color_id")
+        self._write_links(self.type_links, Type, self.known_types, card_types, "type_id")
+        self._write_legalities(card_ids)
+        if self.update_summaries:
+            refresh_set_summaries(row["set_code"] for row in self.cards)
+        # Upserts keep a card's rowid; tell the name index (autocomplete.py) to reload
+        rewrote = self.updated > updated if self.incremental else not self.only_new
+        if rewrote:
+            mark_cards_rewritten()
+        bump_catalog_version()
+        if self.autocommit:
+            self.session.commit()
+
+        self.written += batch_size
+        logging.info(f"Processed {self.written} cards...")
+        self.cards = []
+        self.color_links = []
+        self.type_links = []
+        self.legality_rows = []
+
+
+def ingest_scryfall_cards(cards_data):
+    """Store one page of Scryfall API results, skipping cards we already have.
+
+    The statement count is fixed per page, however many cards it holds:
+    one IN lookup for known ids, the Color/Type preload and one
+    executemany each for cards, new lookups and association rows.
+    Doesn't commit; run it through the write queue. Returns the number
+    of new cards.
+    """
+    ids = [card_data["id"] for card_data in cards_data]
+    if not ids:
+        return 0
+    existing = {card_id for (card_id,) in db.session.query(Card.id).filter(Card.id.in_(ids))}
+    new_cards = [card_data for card_data in cards_data if card_data["id"] not in existing]
+    if not new_cards:
+        return 0
+
+    writer = CardBatchWriter(db.session, batch_size=len(new_cards) + 1, autocommit=False, only_new=True)
+    for card_data in new_cards:
+        writer.add(card_data)
+    writer.flush()
+    return writer.written
+
+
+def import_bulk_data_from_file(path, batch_size=None, incremental=False):
+    """Stream a Scryfall bulk data dump (default-cards, all-cards, ...) into the database
+
+    With incremental=True only cards whose content hash differs from the
+    stored one are upserted. Returns the writer so callers can report counts.
+    """
+    if batch_size is None:
+        batch_size = DEFAULT_SYNC_BATCH_SIZE if incremental else DEFAULT_BATCH_SIZE
+    mode = "Syncing" if incremental else "Importing"
+    logging.info(f"{mode} bulk data from {path}")
+    started = time.monotonic()
+    writer = CardBatchWriter(db.session, batch_size=batch_size, incremental=incremental, update_summaries=False)
+
+    try:
+        with open_bulk_file(path) as f:
+            for card_data in iter_bulk_cards(f):
+                writer.add(card_data)
+        writer.flush()
+        refresh_set_summaries()
+        mark_bulk_imported(os.path.basename(path))
+    except Exception:
+        db.session.rollback()
+        raise
+
+    elapsed = time.monotonic() - started
+    if incremental:
+        logging.info(
+            f"Synced {writer.written} cards in {elapsed:.1f}s: {writer.inserted} inserted, "
+            f"{writer.updated} updated, {writer.unchanged} unchanged"
+        )
+    else:
+        logging.info(f"Imported {writer.written} cards in {elapsed:.1f}s")
+    return writer
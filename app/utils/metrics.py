@@ -0,0 +1,248 @@
+"""Request instrumentation, exposed in Prometheus text format at /metrics.
+
+Every request records its duration, the SQL statements it ran (count and
+time, via SQLAlchemy cursor events), outbound HTTP calls made through the
+shared requests session, and time spent in render_template. Totals across
+all threads (background downloads, the writer thread, ...) go into the
+same histograms. With SERVER_TIMING on, the per-request breakdown is also
+sent as a Server-Timing header for the browser's network panel.
+
+Metrics are per process; with several gunicorn workers, scrape each one
+or aggregate them in Prometheus.
+"""
+import contextvars
+import threading
+import time
+
+from flask import before_render_template, g, request, template_rendered
+from sqlalchemy import event
+
+from ..models import db
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "mtgdb_http_request_duration_seconds", "Time spent handling a request.", ("method", "endpoint", "status"))
+REQUEST_SQL_STATEMENTS = Histogram(
+    "mtgdb_http_request_sql_statements", "SQL statements executed per request.", ("endpoint",), COUNT_BUCKETS)
+REQUEST_SQL_DURATION = Histogram(
+    "mtgdb_http_request_sql_duration_seconds", "Time spent in SQL per request.", ("endpoint",))
+REQUEST_UPSTREAM_DURATION = Histogram(
+    "mtgdb_http_request_upstream_duration_seconds", "Time spent waiting on outbound HTTP per request.", ("endpoint",))
+REQUEST_RENDER_DURATION = Histogram(
+    "mtgdb_http_request_render_duration_seconds", "Time spent rendering templates per request.", ("endpoint",))
+SQL_DURATION = Histogram(
+    "mtgdb_sql_statement_duration_seconds", "Duration of individual SQL statements, all threads.")
+UPSTREAM_DURATION = Histogram(
+    "mtgdb_upstream_request_duration_seconds", "Outbound HTTP requests until headers arrived, all threads.",
+    ("host", "status"))
+UPSTREAM_ERRORS = Counter(
+    "mtgdb_upstream_request_errors_total", "Outbound HTTP requests that failed before a response.", ("host",))
+UPSTREAM_SHED = Counter(
+    "mtgdb_upstream_requests_shed_total", "Outbound requests refused locally (utils/upstream.py).",
+    ("host", "reason"))
+UPSTREAM_WAITS = Counter(
+    "mtgdb_upstream_waits_total", "Request-path waits on upstream work, by outcome.", ("result",))
+TEMPLATE_DURATION = Histogram(
+    "mtgdb_template_render_duration_seconds", "render_template calls by template.", ("template",))
+FRAGMENT_LOOKUPS = Counter(
+    "mtgdb_fragment_cache_lookups_total", "Rendered-page cache lookups (utils/fragments.py).", ("result",))
+
+METRICS = [
+    REQUEST_DURATION, REQUEST_SQL_STATEMENTS, REQUEST_SQL_DURATION, REQUEST_UPSTREAM_DURATION,
+    REQUEST_RENDER_DURATION, SQL_DURATION, UPSTREAM_DURATION, UPSTREAM_ERRORS, UPSTREAM_SHED,
+    UPSTREAM_WAITS, TEMPLATE_DURATION, FRAGMENT_LOOKUPS,
+]
+
+
+class RequestStats:
+    __slots__ = ("started", "sql_count", "sql_time", "upstream_count", "upstream_time", "render_time")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.upstream_count = 0
+        self.upstream_time = 0.0
+        self.render_time = 0.0
+
+
+# Stats of the request being handled on this thread, None elsewhere
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def record_upstream(host, seconds, status=None):
+    """Account one outbound HTTP call (called by the shared requests session)"""
+    if status is None:
+        UPSTREAM_ERRORS.inc(host=host)
+    else:
+        UPSTREAM_DURATION.observe(seconds, host=host, status=str(status))
+    stats = _current.get()
+    if stats is not None:
+        stats.upstream_count += 1
+        stats.upstream_time += seconds
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    SQL_DURATION.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_time += elapsed
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute doesn't fire for failed statements
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+_render_started = threading.local()
+
+
+def _before_render(sender, template, context, **extra):
+    stack = getattr(_render_started, "stack", None)
+    if stack is None:
+        stack = _render_started.stack = []
+    stack.append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    stack = getattr(_render_started, "stack", None)
+    if not stack:
+        return
+    elapsed = time.perf_counter() - stack.pop()
+    TEMPLATE_DURATION.observe(elapsed, template=template.name or "")
+    stats = _current.get()
+    if stats is not None and not stack:  # Nested render_template calls are already counted
+        stats.render_time += elapsed
+
+
+def _server_timing(stats, total):
+    return ", ".join([
+        f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.sql_count} queries"',
+        f'upstream;dur={stats.upstream_time * 1000:.1f};desc="{stats.upstream_count} requests"',
+        f"render;dur={stats.render_time * 1000:.1f}",
+        f"total;dur={total * 1000:.1f}",
+    ])
+
+
+def init_metrics(app):
+    """Install the SQL, template and request hooks; call inside an app context"""
+    event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db.engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(db.engine, "handle_error", _handle_error)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_template_rendered, app)
+
+    @app.before_request
+    def start_request_stats():
+        stats = RequestStats()
+        g.metrics_token = _current.set(stats)
+
+    @app.after_request
+    def record_request_stats(response):
+        stats = _current.get()
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats.started
+        endpoint = request.endpoint or "unmatched"
+        REQUEST_DURATION.observe(total, method=request.method, endpoint=endpoint, status=str(response.status_code))
+        REQUEST_SQL_STATEMENTS.observe(stats.sql_count, endpoint=endpoint)
+        REQUEST_SQL_DURATION.observe(stats.sql_time, endpoint=endpoint)
+        REQUEST_UPSTREAM_DURATION.observe(stats.upstream_time, endpoint=endpoint)
+        REQUEST_RENDER_DURATION.observe(stats.render_time, endpoint=endpoint)
+        if app.config["SERVER_TIMING"]:
+            response.headers["Server-Timing"] = _server_timing(stats, total)
+        return response
+
+    @app.teardown_request
+    def clear_request_stats(exc):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            _current.reset(token)
@@ -0,0 +1,99 @@
+import json
+import logging
+
+from sqlalchemy import insert, inspect, text
+
+from ..models import db, card_legalities
+from .colors import COLOR_BITS, color_mask, identity_from_text
+from .search import ensure_search_index
+from .sets import summary_upsert
+
+
+def _add_missing_columns(conn, inspector, table):
+    """Add columns declared on the model but missing from an existing table"""
+    existing = {column["name"] for column in inspector.get_columns(table.name)}
+    added = []
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        logging.info(f"Adding column {table.name}.{column.name}")
+        conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+        added.append((table.name, column.name))
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+    return added
+
+
+def _backfill_color_masks(conn):
+    """Derive color masks for cards stored before the columns existed.
+
+    Colors come from card_colors; the identity is rebuilt from the colors
+    plus every mana symbol in the cost and rules text.
+    """
+    logging.info("Backfilling card color masks...")
+    rows = conn.execute(text("""
+        SELECT card.id, card.mana_cost, card.mana_costs, card.oracle_text, group_concat(color.name)
+        FROM card
+        LEFT JOIN card_colors ON card_colors.card_id = card.id
+        LEFT JOIN color ON color.id = card_colors.color_id
+        GROUP BY card.id
+    """))
+    updates = []
+    for card_id, mana_cost, mana_costs, oracle_text, color_names in rows:
+        colors = [c for c in (color_names or "").split(",") if c in COLOR_BITS]
+        identity = identity_from_text(mana_cost, mana_costs, oracle_text) | set(colors)
+        updates.append({"id": card_id, "colors": color_mask(colors), "identity": color_mask(identity)})
+    if updates:
+        conn.execute(
+            text("UPDATE card SET color_mask = :colors, color_identity_mask = :identity WHERE id = :id"),
+            updates,
+        )
+
+
+def _backfill_legalities(conn):
+    """Split the stored legalities JSON into card_legalities rows"""
+    logging.info("Backfilling card legalities...")
+    rows = []
+    for card_id, legalities in conn.execute(text("SELECT id, legalities FROM card WHERE legalities IS NOT NULL")):
+        for fmt, status in json.loads(legalities or "{}").items():
+            if status != "not_legal":
+                rows.append({"card_id": card_id, "format": fmt, "status": status})
+    if rows:
+        conn.execute(insert(card_legalities), rows)
+
+
+def _backfill_set_summaries(conn):
+    logging.info("Counting cards per set...")
+    conn.execute(summary_upsert())
+
+
+# Run once, right after the column or table they populate has been added
+# (tables are keyed as (name, None))
+BACKFILLS = {
+    ("card", "color_mask"): _backfill_color_masks,
+    ("card_legalities", None): _backfill_legalities,
+    ("set_summary", None): _backfill_set_summaries,
+}
+
+
+def upgrade_schema():
+    """Bring an existing database up to date with the models.
+
+    Missing tables are created as db.create_all() would; columns added to a
+    model after the database was first created are added here, and both
+    are backfilled from the data already stored.
+    """
+    with db.engine.begin() as conn:
+        inspector = inspect(conn)
+        added = []
+        for table in db.metadata.sorted_tables:
+            if inspector.has_table(table.name):
+                added.extend(_add_missing_columns(conn, inspector, table))
+            else:
+                table.create(conn)
+                added.append((table.name, None))
+        for column in added:
+            if column in BACKFILLS:
+                BACKFILLS[column](conn)
+        ensure_search_index(conn)
@@ -0,0 +1,38 @@
+import base64
+import json
+from collections import namedtuple
+
+from sqlalchemy import tuple_
+
+# One page of results plus the opaque token that continues after it
+CardPage = namedtuple("CardPage", "cards next_cursor")
+
+
+def encode_cursor(sort_key, page):
+    """Opaque continuation token for the row after sort_key.
+
+    page counts the pages served so far; it's only used to pick the
+    matching page when a short result is filled from Scryfall.
+    """
+    payload = json.dumps({"k": list(sort_key), "p": page}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        sort_key, page = payload["k"], int(payload["p"])
+    except (TypeError, KeyError, UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(sort_key, list):
+        raise ValueError("Invalid cursor")
+    return sort_key, page
+
+
+def seek_after(query, sort_columns, sort_key):
+    """Keyset condition: rows strictly after sort_key in (sort_columns) order"""
+    if len(sort_key) != len(sort_columns):
+        raise ValueError("Cursor doesn't match this query")
+    return query.filter(tuple_(*sort_columns) > tuple_(*sort_key))
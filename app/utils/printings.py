@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from ..models import db, Card, Set
+from .catalog import get_catalog_version
+
+# Just the fields card_detail.html shows for each printing
+Printing = namedtuple(
+    "Printing",
+    "id set_code set_name set_icon_path set_icon_url collector_number released_at local_image_path image_uri",
+)
+
+MAX_CACHED_ORACLE_IDS = 4096
+
+_cache = OrderedDict()  # oracle_id -> (catalog version, printings)
+_lock = threading.Lock()
+
+
+def _load_printings(oracle_id):
+    rows = (
+        db.session.query(
+            Card.id,
+            Card.set_code,
+            Set.name,
+            Set.local_icon_path,
+            Set.icon_url,
+            Card.collector_number,
+            Card.released_at,
+            Card.local_image_path,
+            Card.image_uri,
+        )
+        .outerjoin(Set, Set.code == Card.set_code)
+        .filter(Card.oracle_id == oracle_id)
+        .order_by(Card.released_at.desc(), Card.set_code, Card.collector_number)
+        .all()
+    )
+    return tuple(Printing(*row) for row in rows)
+
+
+def get_printings(oracle_id):
+    """Every printing of a card, in one indexed query, memoized per oracle_id.
+
+    Entries are dropped when the catalog version changes (any import or
+    ingest bumps it).
+    """
+    if not oracle_id:
+        return ()
+    version = get_catalog_version()
+    with _lock:
+        cached = _cache.get(oracle_id)
+        if cached and cached[0] == version:
+            _cache.move_to_end(oracle_id)
+            return cached[1]
+
+    printings = _load_printings(oracle_id)
+    with _lock:
+        _cache[oracle_id] = (version, printings)
+        _cache.move_to_end(oracle_id)
+        while len(_cache) > MAX_CACHED_ORACLE_IDS:
+            _cache.popitem(last=False)
+    return printings
+
@@ -0,0 +1,399 @@
+"""Local implementation of the common parts of Scryfall's search syntax.
+
+A query string such as ``t:goblin (c:r or c:g) id<=rg cmc<=2 -o:"draw a card"`` is
+tokenized, parsed into a small AST and compiled into a single SQLAlchemy
+filter over the card tables. Compiled plans are cached per query string.
+"""
+import functools
+import re
+from collections import namedtuple
+
+from sqlalchemy import Float, and_, case, cast, false, literal_column, not_, or_, select
+
+from ..models import Card, card_legalities
+from .colors import masks_matching, multicolored_masks
+from .search import card_fts, fts_match_expression
+
+
+class QueryError(ValueError):
+    """Raised for query strings that can't be parsed or aren't supported locally"""
+
+
+# --- Tokenizer ---------------------------------------------------------------
+
+Token = namedtuple("Token", "kind value")
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<term>(?P<neg>-)?(?P<key>[A-Za-z]+)(?P<op>>=|<=|!=|:|=|>|<)(?P<value>"[^"]*"|[^\s()]*))
+  | (?P<exact>(?P<exact_neg>-)?!(?P<exact_value>"[^"]*"|[^\s()]+))
+  | (?P<word>(?P<word_neg>-)?(?P<word_value>"[^"]*"|[^\s()"]+))
+""", re.VERBOSE)
+
+
+def tokenize(query_string):
+    tokens = []
+    position = 0
+    while position < len(query_string):
+        match = _TOKEN_RE.match(query_string, position)
+        if not match:
+            raise QueryError(f"Unexpected character at position {position}: {query_string[position]!r}")
+        position = match.end()
+        if match.group("ws"):
+            continue
+        if match.group("lparen"):
+            tokens.append(Token("(", "("))
+        elif match.group("rparen"):
+            tokens.append(Token(")", ")"))
+        elif match.group("term"):
+            if match.group("neg"):
+                tokens.append(Token("not", "-"))
+            value = match.group("value")
+            if not value:
+                raise QueryError(f"Missing value after {match.group('key')}{match.group('op')}")
+            tokens.append(Token("term", (match.group("key").lower(), match.group("op"), value)))
+        elif match.group("exact"):
+            if match.group("exact_neg"):
+                tokens.append(Token("not", "-"))
+            tokens.append(Token("exact", _unquote(match.group("exact_value"))[0]))
+        else:
+            if match.group("word_neg"):
+                tokens.append(Token("not", "-"))
+            value = match.group("word_value")
+            keyword = value.lower()
+            if keyword in ("or", "and", "not"):
+                tokens.append(Token(keyword, keyword))
+            else:
+                tokens.append(Token("word", value))
+    return tokens
+
+
+def _unquote(value):
+    """Strip surrounding quotes; returns (text, was_quoted)"""
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1], True
+    if value.startswith('"'):
+        raise QueryError(f"Unterminated quote in {value}")
+    return value, False
+
+
+# --- Parser ------------------------------------------------------------------
+
+And = namedtuple("And", "items")
+Or = namedtuple("Or", "items")
+Not = namedtuple("Not", "item")
+Term = namedtuple("Term", "key op value quoted")
+Text = namedtuple("Text", "value quoted")
+Exact = namedtuple("Exact", "name")
+
+
+class _Parser:
+    """Recursive descent parser: or_expr := and_expr ('or' and_expr)*"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            return None
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QueryError(f"Unexpected {self.peek().value!r}")
+        return node
+
+    def parse_or(self):
+        items = [self.parse_and()]
+        while self.peek() is not None and self.peek().kind == "or":
+            self.next()
+            items.append(self.parse_and())
+        return items[0] if len(items) == 1 else Or(tuple(items))
+
+    def parse_and(self):
+        items = []
+        while True:
+            token = self.peek()
+            if token is None or token.kind in ("or", ")"):
+                break
+            if token.kind == "and":
+                self.next()
+                continue
+            items.append(self.parse_unary())
+        if not items:
+            raise QueryError("Expected a search term")
+        return items[0] if len(items) == 1 else And(tuple(items))
+
+    def parse_unary(self):
+        token = self.next()
+        if token.kind == "not":
+            if self.peek() is None:
+                raise QueryError("Nothing to negate")
+            return Not(self.parse_unary())
+        if token.kind == "(":
+            node = self.parse_or()
+            if self.next() is None:
+                raise QueryError("Missing closing parenthesis")
+            return node
+        if token.kind == "term":
+            key, op, raw_value = token.value
+            value, quoted = _unquote(raw_value)
+            return Term(key, op, value, quoted)
+        if token.kind == "exact":
+            return Exact(token.value)
+        if token.kind == "word":
+            value, quoted = _unquote(token.value)
+            return Text(value, quoted)
+        raise QueryError(f"Unexpected {token.value!r}")
+
+
+def parse_query(query_string):
+    return _Parser(tokenize(query_string or "")).parse()
+
+
+# --- Compiler ----------------------------------------------------------------
+
+QueryPlan = namedtuple("QueryPlan", "where rank_match unique")
+QueryPlan.__doc__ = """A compiled query.
+
+where      -- SQLAlchemy filter for Card, or None for "everything"
+rank_match -- FTS5 MATCH string; callers must join fts_ranked_subquery() on it
+unique     -- 'cards', 'prints' or None, from unique:...
+"""
+
+COLOR_LETTERS = "WUBRG"
+COLOR_NAMES = {"white": "W", "blue": "U", "black": "B", "red": "R", "green": "G"}
+RARITY_ORDER = {"common": 0, "uncommon": 1, "rare": 2, "special": 3, "mythic": 4, "bonus": 5}
+RARITY_ALIASES = {"c": "common", "u": "uncommon", "r": "rare", "s": "special", "m": "mythic", "b": "bonus"}
+
+KEY_ALIASES = {
+    "t": "type", "type": "type",
+    "c": "color", "color": "color", "colors": "color",
+    "id": "identity", "identity": "identity", "ci": "identity",
+    "s": "set", "set": "set", "e": "set", "edition": "set",
+    "cmc": "cmc", "mv": "cmc", "manavalue": "cmc",
+    "pow": "power", "power": "power",
+    "tou": "toughness", "toughness": "toughness",
+    "loy": "loyalty", "loyalty": "loyalty",
+    "o": "oracle", "oracle": "oracle",
+    "r": "rarity", "rarity": "rarity",
+    "n": "name", "name": "name",
+    "lang": "lang", "language": "lang",
+    "f": "legal", "format": "legal", "legal": "legal",
+    "banned": "banned", "restricted": "restricted",
+    "unique": "unique",
+}
+
+NUMERIC_COLUMNS = {"cmc": Card.cmc, "power": Card.power, "toughness": Card.toughness, "loyalty": Card.loyalty}
+
+def _compare(column, op, value):
+    if op in (":", "="):
+        return column == value
+    if op == "!=":
+        return column != value
+    if op == ">":
+        return column > value
+    if op == ">=":
+        return column >= value
+    if op == "<":
+        return column < value
+    return column <= value
+
+
+def _fts_predicate(match):
+    rowids = select(card_fts.c.rowid).where(literal_column("card_fts").op("MATCH")(match))
+    return literal_column("card.rowid").in_(rowids)
+
+
+def _parse_colors(value):
+    lowered = value.lower()
+    if lowered in COLOR_NAMES:
+        return {COLOR_NAMES[lowered]}
+    if lowered in ("c", "colorless"):
+        return set()
+    letters = set(value.upper())
+    if not letters or not letters <= set(COLOR_LETTERS):
+        raise QueryError(f"Unknown color {value!r}")
+    return letters
+
+
+def _compile_color(column, op, value, default_op):
+    """Color filters compile to an IN-list of matching masks, which the mask indexes can seek"""
+    if op == ":":
+        op = default_op
+    if value.lower() in ("m", "multicolor"):
+        masks = multicolored_masks()
+        if op not in (":", "=", ">="):
+            return or_(column.is_(None), column.notin_(masks))
+        return column.in_(masks)
+    return column.in_(masks_matching(op, _parse_colors(value)))
+
+
+def _compile_numeric(field, op, value):
+    column = cast(NUMERIC_COLUMNS[field], Float)
+    other = KEY_ALIASES.get(value.lower())
+    if other in NUMERIC_COLUMNS:
+        return and_(NUMERIC_COLUMNS[field].isnot(None), _compare(column, op, cast(NUMERIC_COLUMNS[other], Float)))
+    try:
+        number = float(value)
+    except ValueError:
+        raise QueryError(f"{field} needs a number, got {value!r}")
+    return and_(NUMERIC_COLUMNS[field].isnot(None), _compare(column, op, number))
+
+
+def _compile_rarity(op, value):
+    rarity = RARITY_ALIASES.get(value.lower(), value.lower())
+    if rarity not in RARITY_ORDER:
+        raise QueryError(f"Unknown rarity {value!r}")
+    if op in (":", "=", "!="):
+        return _compare(Card.rarity, op, rarity)
+    rank = case(RARITY_ORDER, value=Card.rarity, else_=None)
+    return _compare(rank, op, RARITY_ORDER[rarity])
+
+
+def escape_like(value):
+    """value with its LIKE wildcards escaped by backslashes"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _compile_type(op, value):
+    if op not in (":", "="):
+        raise QueryError("type only supports ':'")
+    # Matched against the whole type line, so t:"legendary creature" works;
+    # SQLite's LIKE ignores case
+    return Card.type_line.like(f"%{escape_like(value)}%", escape="\\")
+
+
+def _compile_legality(field, op, value):
+    if op not in (":", "="):
+        raise QueryError(f"{field} only supports ':'")
+    # Restricted cards are still playable, so they count as legal
+    statuses = ["legal", "restricted"] if field == "legal" else [field]
+    card_ids = select(card_legalities.c.card_id).where(
+        card_legalities.c.format == value.lower(),
+        card_legalities.c.status.in_(statuses),
+    )
+    return Card.id.in_(card_ids)
+
+
+def _text_match(node):
+    """FTS5 match string for a text-like node, or None if it isn't one"""
+    if isinstance(node, Text):
+        return fts_match_expression(node.value, "name", phrase=node.quoted) or ""
+    if isinstance(node, Term) and node.op == ":":
+        field = KEY_ALIASES.get(node.key)
+        if field == "name":
+            return fts_match_expression(node.value, "name", phrase=node.quoted) or ""
+        if field == "oracle":
+            return fts_match_expression(node.value, "oracle_text", prefix=False, phrase=node.quoted) or ""
+    return None
+
+
+def _compile_node(node):
+    if isinstance(node, And):
+        return and_(*[_compile_node(item) for item in node.items])
+    if isinstance(node, Or):
+        return or_(*[_compile_node(item) for item in node.items])
+    if isinstance(node, Not):
+        return not_(_compile_node(node.item))
+    if isinstance(node, Exact):
+        return Card.name == node.name
+
+    match = _text_match(node)
+    if match is not None:
+        return _fts_predicate(match) if match else false()
+    if isinstance(node, Text):
+        return false()
+
+    field = KEY_ALIASES.get(node.key)
+    if field is None:
+        raise QueryError(f"Unsupported search keyword {node.key!r}")
+    if field == "type":
+        return _compile_type(node.op, node.value)
+    if field == "color":
+        return _compile_color(Card.color_mask, node.op, node.value, ">=")
+    if field == "identity":
+        # Like Scryfall, id: means "fits in a deck of these colors"
+        return _compile_color(Card.color_identity_mask, node.op, node.value, "<=")
+    if field == "set":
+        return _compare(Card.set_code, node.op if node.op == "!=" else "=", node.value.lower())
+    if field in NUMERIC_COLUMNS:
+        return _compile_numeric(field, node.op, node.value)
+    if field == "rarity":
+        return _compile_rarity(node.op, node.value)
+    if field == "lang":
+        return _compare(Card.lang, node.op if node.op == "!=" else "=", node.value.lower())
+    if field in ("legal", "banned", "restricted"):
+        return _compile_legality(field, node.op, node.value)
+    if field in ("name", "oracle"):
+        raise QueryError(f"{node.key} only supports ':'")
+    raise QueryError(f"{node.key} can't be used here")
+
+
+def _unique_mode(node):
+    if isinstance(node, Term) and KEY_ALIASES.get(node.key) == "unique":
+        mode = node.value.lower()
+        if mode not in ("cards", "prints", "art"):
+            raise QueryError(f"Unknown unique mode {node.value!r}")
+        return mode
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_query(query_string):
+    """Compile a Scryfall-style query string into a QueryPlan (cached per string)"""
+    root = parse_query(query_string)
+    if root is None:
+        return QueryPlan(None, None, None)
+
+    items = _flatten_and(root)
+
+    # Top-level directives and positive text terms are pulled out of the
+    # filter: text terms drive the bm25-ranked FTS join instead.
+    unique = None
+    rank_parts = []
+    filters = []
+    for item in items:
+        mode = _unique_mode(item)
+        if mode:
+            unique = mode
+            continue
+        match = _text_match(item)
+        if match:
+            rank_parts.append(match)
+            continue
+        filters.append(item)
+
+    for item in filters:
+        if _unique_mode_nested(item):
+            raise QueryError("unique: can only be used at the top level")
+
+    where = None
+    if filters:
+        where = and_(*[_compile_node(item) for item in filters])
+    rank_match = " AND ".join(rank_parts) if rank_parts else None
+    return QueryPlan(where, rank_match, unique)
+
+
+def _flatten_and(node):
+    """Top-level conjuncts, looking through nested parentheses like (a (b c))"""
+    if isinstance(node, And):
+        return [leaf for item in node.items for leaf in _flatten_and(item)]
+    return [node]
+
+
+def _unique_mode_nested(node):
+    if isinstance(node, (And, Or)):
+        return any(_unique_mode_nested(item) for item in node.items)
+    if isinstance(node, Not):
+        return _unique_mode_nested(node.item)
+    return isinstance(node, Term) and KEY_ALIASES.get(node.key) == "unique"
@@ -0,0 +1,90 @@
+import logging
+import re
+
+from sqlalchemy import column, func, literal_column, select, table, text
+
+# The FTS5 index lives outside the SQLAlchemy metadata (create_all can't
+# create virtual tables), so it is described with a lightweight table().
+card_fts = table(
+    "card_fts",
+    column("rowid"),
+    column("card_fts"),
+    column("name"),
+    column("type_line"),
+    column("oracle_text"),
+)
+
+FTS_COLUMNS = ("name", "type_line", "oracle_text")
+# bm25 weights per column: a hit in the name counts far more than one in rules text
+BM25_WEIGHTS = (10.0, 3.0, 1.0)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS card_fts USING fts5(
+        name, type_line, oracle_text,
+        content='card', content_rowid='rowid',
+        tokenize="unicode61 remove_diacritics 2",
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS card_fts_ai AFTER INSERT ON card BEGIN
+        INSERT INTO card_fts(rowid, name, type_line, oracle_text)
+        VALUES (new.rowid, new.name, new.type_line, new.oracle_text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS card_fts_ad AFTER DELETE ON card BEGIN
+        INSERT INTO card_fts(card_fts, rowid, name, type_line, oracle_text)
+        VALUES ('delete', old.rowid, old.name, old.type_line, old.oracle_text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS card_fts_au AFTER UPDATE OF name, type_line, oracle_text ON card BEGIN
+        INSERT INTO card_fts(card_fts, rowid, name, type_line, oracle_text)
+        VALUES ('delete', old.rowid, old.name, old.type_line, old.oracle_text);
+        INSERT INTO card_fts(rowid, name, type_line, oracle_text)
+        VALUES (new.rowid, new.name, new.type_line, new.oracle_text);
+    END
+    """,
+]
+
+
+def ensure_search_index(conn):
+    """Create the FTS5 index and its sync triggers, populating it on first creation"""
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'card_fts'")
+    ).first()
+    for statement in SEARCH_INDEX_DDL:
+        conn.execute(text(statement))
+    if not exists:
+        logging.info("Building full-text search index...")
+        conn.execute(text("INSERT INTO card_fts(card_fts) VALUES ('rebuild')"))
+
+
+def fts_match_expression(search_string, column_name=None, prefix=True, phrase=False):
+    """Turn free text into an FTS5 query: every word must match, as a prefix by default"""
+    words = _WORD_RE.findall(search_string or "")
+    if not words:
+        return None
+    if phrase:
+        terms = '"' + " ".join(words) + '"'
+    else:
+        suffix = "*" if prefix else ""
+        terms = "(" + " ".join(f'"{word}"{suffix}' for word in words) + ")"
+    if column_name:
+        return f"{column_name} : {terms}"
+    return terms
+
+
+def fts_ranked_subquery(match_expression):
+    """rowids of cards matching an FTS query, with their bm25 rank (lower is better)"""
+    rank = func.bm25(literal_column("card_fts"), *BM25_WEIGHTS)
+    return (
+        select(card_fts.c.rowid.label("rowid"), rank.label("rank"))
+        .select_from(card_fts)
+        .where(literal_column("card_fts").op("MATCH")(match_expression))
+        .subquery()
+    )
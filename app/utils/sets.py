@@ -0,0 +1,198 @@
+"""Set catalog: per-set card counts and the set icon sprite.
+
+set_summary holds one row per set: how many cards it has, how many have
+a local image copy, and how many of each rarity. Ingests recount the sets
+they touched in the same transaction, and bulk imports recount everything
+once at the end. Image downloads recount the card's set.
+
+All downloaded set icons are merged into one SVG sprite of <symbol>
+elements (sets_icons/sprite-<hash>.svg), so the /sets page fetches all
+of its icons in a single request. The sprite is rebuilt a few seconds after icon
+downloads stop arriving, and by flask sync-sets. Its path is kept in
+catalog_meta under "set_sprite".
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from ..models import db, Card, Set, SetSummary
+from .catalog import bump_catalog_version, get_meta, set_meta
+from .storage import run_write
+
+RARITIES = ("common", "uncommon", "rare", "mythic")
+SPRITE_META_KEY = "set_sprite"
+SPRITE_BUILD_DELAY = 5.0  # seconds without a new icon before the sprite is rebuilt
+
+_SVG_RE = re.compile(r"<svg\b([^>]*)>(.*)</svg>", re.DOTALL | re.IGNORECASE)
+_VIEWBOX_RE = re.compile(r"""\bviewBox\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+_SIZE_RE = re.compile(r"""\b(width|height)\s*=\s*["']([\d.]+)""", re.IGNORECASE)
+
+
+def _summary_select():
+    rarity_counts = [
+        func.sum(case((Card.rarity == rarity, 1), else_=0)) for rarity in RARITIES
+    ]
+    return (
+        select(
+            Card.set_code,
+            func.count(),
+            func.count(Card.local_image_path),
+            *rarity_counts,
+            func.sum(case((Card.rarity.in_(RARITIES), 0), else_=1)),
+        )
+        .group_by(Card.set_code)
+    )
+
+
+def summary_upsert(set_codes=None):
+    """INSERT ... SELECT recounting the given sets, or every set with cards"""
+    columns = ["set_code", "card_count", "cached_count"] + [f"{r}_count" for r in RARITIES] + ["other_count"]
+    query = _summary_select()
+    if set_codes is None:
+        query = query.where(Card.set_code.isnot(None))
+    else:
+        query = query.where(Card.set_code.in_(set_codes))
+    stmt = insert(SetSummary).from_select(columns, query)
+    return stmt.on_conflict_do_update(
+        index_elements=[SetSummary.set_code],
+        set_={column: stmt.excluded[column] for column in columns[1:]},
+    )
+
+
+def refresh_set_summaries(set_codes=None):
+    """Recount the given sets (all of them by default); the caller commits"""
+    if set_codes is None:
+        db.session.execute(delete(SetSummary))
+    else:
+        set_codes = sorted({code for code in set_codes if code})
+        if not set_codes:
+            return
+    db.session.execute(summary_upsert(set_codes))
+
+
+def list_sets(set_type=None, sort="name", direction="asc"):
+    """(Set, SetSummary or None) pairs, filtered and ordered in SQL"""
+    column = Set.name if sort == "name" else Set.released_at
+    # Both keys in one direction, so the (set_type, column, code) indexes give the order
+    if direction == "asc":
+        order = (column.asc(), Set.code.asc())
+    else:
+        order = (column.desc(), Set.code.desc())
+    query = (
+        db.session.query(Set, SetSummary)
+        .outerjoin(SetSummary, SetSummary.set_code == Set.code)
+        .order_by(*order)
+    )
+    if set_type:
+        query = query.filter(Set.set_type == set_type)
+    return query.all()
+
+
+def set_types():
+    """Every set type in the catalog, for the filter menu"""
+    query = db.session.query(Set.set_type).filter(Set.set_type.isnot(None)).distinct().order_by(Set.set_type)
+    return [set_type for (set_type,) in query]
+
+
+def _icon_symbol(code, svg):
+    """The icon's drawing as a <symbol id="set-CODE">, or None if it can't be read"""
+    match = _SVG_RE.search(svg)
+    if not match:
+        return None
+    attributes, body = match.groups()
+    view_box = _VIEWBOX_RE.search(attributes)
+    if view_box:
+        view_box = view_box.group(1)
+    else:
+        size = dict((name.lower(), value) for name, value in _SIZE_RE.findall(attributes))
+        if "width" not in size or "height" not in size:
+            return None
+        view_box = f"0 0 {size['width']} {size['height']}"
+    return f'<symbol id="set-{code}" viewBox="{view_box}">{body.strip()}</symbol>'
+
+
+def _store_sprite(path):
+    set_meta(SPRITE_META_KEY, path)
+    bump_catalog_version()  # Cached set pages refer to the sprite by name
+
+
+def build_set_sprite(app):
+    """Merge every downloaded set icon into one sprite; returns its static path"""
+    directory = os.path.join(app.static_folder, "sets_icons")
+    symbols = []
+    for code, icon_path in db.session.query(Set.code, Set.local_icon_path).filter(
+            Set.local_icon_path.isnot(None)).order_by(Set.code):
+        try:
+            with open(os.path.join(app.static_folder, icon_path), encoding="utf-8") as f:
+                symbol = _icon_symbol(code, f.read())
+        except (OSError, UnicodeDecodeError) as e:
+            logging.warning(f"Skipping icon of set {code}: {e}")
+            continue
+        if symbol:
+            symbols.append(symbol)
+    if not symbols:
+        return None
+
+    sprite = ('<svg xmlns="http://www.w3.org/2000/svg">\n'
+              + "\n".join(symbols) + "\n</svg>\n").encode("utf-8")
+    filename = f"sprite-{hashlib.sha1(sprite).hexdigest()[:12]}.svg"
+    path = f"sets_icons/{filename}"
+    if get_meta(SPRITE_META_KEY) == path:
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".sprite-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(sprite)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, os.path.join(directory, filename))
+    old_path = get_meta(SPRITE_META_KEY)
+    run_write(_store_sprite, path)
+    # Keep the previous sprite; pages rendered before the switch still use it
+    for name in os.listdir(directory):
+        if name.startswith("sprite-") and name != filename and f"sets_icons/{name}" != old_path:
+            os.remove(os.path.join(directory, name))
+    logging.info(f"Built set icon sprite {path} with {len(symbols)} icons")
+    return path
+
+
+_sprite_timer = None
+_sprite_lock = threading.Lock()
+
+
+def _build_sprite_in_background(app):
+    global _sprite_timer
+    with _sprite_lock:
+        _sprite_timer = None
+    try:
+        with app.app_context():
+            build_set_sprite(app)
+    except Exception as e:
+        logging.error(f"Error building set icon sprite: {e}")
+
+
+def schedule_sprite_build(app, delay=SPRITE_BUILD_DELAY):
+    """Rebuild the sprite once icon downloads have been quiet for delay seconds"""
+    global _sprite_timer
+    if app.config["SNAPSHOT_PATH"]:
+        return
+    with _sprite_lock:
+        if _sprite_timer is not None:
+            _sprite_timer.cancel()
+        _sprite_timer = threading.Timer(delay, _build_sprite_in_background, args=(app,))
+        _sprite_timer.daemon = True
+        _sprite_timer.start()
+
+
+def init_set_sprite(app):
+    """Build the sprite at startup if icons were downloaded before it existed"""
+    if app.config["SNAPSHOT_PATH"] or get_meta(SPRITE_META_KEY):
+        return
+    if db.session.query(Set.query.filter(Set.local_icon_path.isnot(None)).exists()).scalar():
+        schedule_sprite_build(app, delay=0)
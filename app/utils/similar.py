@@ -0,0 +1,200 @@
+"""Similar cards: nearest neighbours over oracle text and type line.
+
+`flask build-similar` turns every distinct oracle_id into a TF-IDF vector
+of its rules text (words and word pairs, card name replaced by "~",
+reminder text dropped) and type line words, hashed down to
+SIMILAR_INDEX_DIM signed dimensions and L2-normalised. The matrix is
+saved as .npy files in SIMILAR_INDEX_DIR; workers open them with
+mmap_mode="r", so they share the same pages. A lookup is one matrix
+product of the query rows against the whole catalog plus argpartition.
+
+NumPy is optional; without it (or before the index is built) the card
+page simply has no similar-cards panel.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+from sqlalchemy import func
+
+from ..models import db, Card
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the install
+    np = None
+
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "oracle_ids.npy"
+META_FILE = "meta.json"
+RELOAD_CHECK_INTERVAL = 5.0  # seconds between checks for a rebuilt index
+
+REMINDER_RE = re.compile(r"\([^)]*\)")
+TOKEN_RE = re.compile(r"\{[^}]+\}|[+-]?\d+/[+-]?\d+|[a-z0-9~']+")
+
+
+def similarity_supported():
+    return np is not None
+
+
+def card_features(name, type_line, oracle_text):
+    """Feature -> count for one card"""
+    text = (oracle_text or "").lower()
+    for face_name in (name or "").lower().split(" // "):
+        if face_name:
+            text = text.replace(face_name, "~")
+    words = TOKEN_RE.findall(REMINDER_RE.sub(" ", text))
+    features = Counter(words)
+    features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    # Type words count double: a Goblin should look like other Goblins
+    for word in re.findall(r"[a-z]+", (type_line or "").lower()):
+        features[f"type:{word}"] += 2
+    return features
+
+
+def _bucket(feature, dim):
+    """Stable (column, sign) for a feature; Python's hash() differs per process"""
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % dim, 1.0 if h & 0x80000000 else -1.0
+
+
+def _load_oracle_cards():
+    # One row per oracle_id; SQLite returns the other columns from any of its printings
+    return (
+        db.session.query(Card.oracle_id, Card.name, Card.type_line, Card.oracle_text)
+        .filter(Card.oracle_id.isnot(None))
+        .group_by(Card.oracle_id)
+        .order_by(Card.oracle_id)
+        .all()
+    )
+
+
+def build_similarity_index(directory, dim):
+    """Compute and save the vectors; returns the number of cards indexed"""
+    if np is None:
+        raise RuntimeError("NumPy is not installed")
+    started = time.monotonic()
+    cards = _load_oracle_cards()
+    features = [card_features(name, type_line, text) for _, name, type_line, text in cards]
+
+    document_frequency = Counter()
+    for counts in features:
+        document_frequency.update(counts.keys())
+    total = len(cards)
+    # Features on a single card can't make two cards similar, they only dilute the vectors
+    weights = {
+        feature: math.log((1 + total) / (1 + df)) + 1
+        for feature, df in document_frequency.items() if df > 1
+    }
+    buckets = {feature: _bucket(feature, dim) for feature in weights}
+
+    rows, columns, values = [], [], []
+    for row, counts in enumerate(features):
+        for feature, count in counts.items():
+            weight = weights.get(feature)
+            if weight is None:
+                continue
+            column, sign = buckets[feature]
+            rows.append(row)
+            columns.append(column)
+            values.append(sign * (1 + math.log(count)) * weight)
+    vectors = np.zeros((total, dim), dtype=np.float32)
+    np.add.at(vectors, (np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)),
+              np.array(values, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+    oracle_ids = np.array([oracle_id for oracle_id, _, _, _ in cards], dtype="U36")
+    os.makedirs(directory, exist_ok=True)
+    # Write everything under temporary names, then swap the files in
+    for filename, array in ((VECTORS_FILE, vectors), (IDS_FILE, oracle_ids)):
+        temp_path = os.path.join(directory, f".{filename}.tmp")
+        with open(temp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(temp_path, os.path.join(directory, filename))
+    meta_path = os.path.join(directory, META_FILE)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump({"cards": total, "dim": dim, "features": len(weights), "built_at": time.time()}, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    logging.info(f"Built similarity index for {total} cards ({len(weights)} features) "
+                 f"in {time.monotonic() - started:.1f}s")
+    return total
+
+
+class SimilarityIndex:
+    def __init__(self, directory):
+        self.vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r")
+        oracle_ids = np.load(os.path.join(directory, IDS_FILE))
+        self.oracle_ids = oracle_ids.tolist()
+        self.rows = {oracle_id: row for row, oracle_id in enumerate(self.oracle_ids)}
+
+    def neighbours(self, oracle_ids, limit):
+        """oracle_id -> most similar oracle_ids, best first, for every known id"""
+        known = [oracle_id for oracle_id in oracle_ids if oracle_id in self.rows]
+        if not known or len(self.oracle_ids) < 2:
+            return {}
+        limit = min(limit, len(self.oracle_ids) - 1)
+        query_rows = np.array([self.rows[oracle_id] for oracle_id in known])
+        scores = self.vectors[query_rows] @ self.vectors.T
+        scores[np.arange(len(known)), query_rows] = -np.inf  # Not similar to itself
+        top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        ordered = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
+        return {
+            oracle_id: [self.oracle_ids[row] for row in ordered[i] if scores[i, row] > 0]
+            for i, oracle_id in enumerate(known)
+        }
+
+
+_index = {"index": None, "mtime": None, "checked_at": 0.0}
+_lock = threading.Lock()
+
+
+def get_similarity_index(directory):
+    """The index in directory, reopened when it has been rebuilt; None if there isn't one"""
+    if np is None:
+        return None
+    now = time.monotonic()
+    if now - _index["checked_at"] < RELOAD_CHECK_INTERVAL:
+        return _index["index"]
+    with _lock:
+        _index["checked_at"] = now
+        try:
+            mtime = os.path.getmtime(os.path.join(directory, META_FILE))
+        except OSError:
+            _index.update(index=None, mtime=None)
+            return None
+        if mtime != _index["mtime"]:
+            try:
+                _index["index"] = SimilarityIndex(directory)
+                _index["mtime"] = mtime
+            except (OSError, ValueError) as e:
+                logging.error(f"Could not open similarity index in {directory}: {e}")
+                _index["index"] = None
+        return _index["index"]
+
+
+def similar_cards(app, card, limit=None):
+    """A representative printing of each card most like this one"""
+    index = get_similarity_index(app.config["SIMILAR_INDEX_DIR"])
+    if index is None or not card.oracle_id:
+        return []
+    oracle_ids = index.neighbours([card.oracle_id], limit or app.config["SIMILAR_CARDS"]).get(card.oracle_id)
+    if not oracle_ids:
+        return []
+    # The newest printing of each (SQLite takes the bare id from the max() row)
+    newest = (
+        db.session.query(Card.id, func.max(Card.released_at))
+        .filter(Card.oracle_id.in_(oracle_ids))
+        .group_by(Card.oracle_id)
+        .subquery()
+    )
+    cards = {c.oracle_id: c for c in Card.query.filter(Card.id.in_(db.select(newest.c.id)))}
+    return [cards[oracle_id] for oracle_id in oracle_ids if oracle_id in cards]
@@ -0,0 +1,225 @@
+"""Read-only catalog snapshots for scaled-out web nodes.
+
+`flask build-snapshot OUTPUT` copies the database into a self-contained
+file for shipping to web nodes:
+- per-node data (the HTTP cache, saved cards and decks) removed
+- VACUUMed, with the full-text index rebuilt
+- ANALYZEd
+- an asset_manifest table listing the static files it references
+- catalog_meta stamped with a snapshot version
+
+With SNAPSHOT_PATH set, the app serves that file read-only. Connections
+open it with immutable=1, so SQLite skips locking and change detection,
+and with a large mmap. Nothing is fetched from Scryfall or written. Every
+SNAPSHOT_CHECK_INTERVAL seconds a request checks whether the path points
+at a new file, and if so the connection pool is swapped over to it. Ship
+a new snapshot by writing it next to the old one and atomically renaming
+it (or repointing a symlink) onto SNAPSHOT_PATH.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from ..models import db
+
+MANIFEST_DDL = "CREATE TABLE asset_manifest (path TEXT PRIMARY KEY, bytes INTEGER NOT NULL) WITHOUT ROWID"
+# Only useful to the node that wrote them
+PER_NODE_TABLES = ("http_cache", "deck_card", "deck", "saved_card")
+
+
+def _static_relative(path):
+    """Asset path relative to the static folder (card images are stored as static/images/...)"""
+    return path[len("static/"):] if path.startswith("static/") else path
+
+
+def _asset_paths(conn):
+    queries = (
+        "SELECT local_image_path FROM card UNION SELECT thumb_image_path FROM card "
+        "UNION SELECT detail_image_path FROM card",
+        'SELECT local_icon_path FROM "set"',
+        "SELECT local_path FROM mana_symbol",
+        "SELECT value FROM catalog_meta WHERE key = 'set_sprite'",
+    )
+    for query in queries:
+        for (path,) in conn.execute(query):
+            if path:
+                yield _static_relative(path)
+
+
+def build_snapshot(app, output):
+    """Write a read-only snapshot of the configured database to output; returns its version"""
+    output = os.path.abspath(output)
+    temp_path = output + ".building"
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        if os.path.exists(temp_path + suffix):
+            os.remove(temp_path + suffix)
+
+    started = time.monotonic()
+    source = sqlite3.connect(app.config["DB_PATH"])
+    target = sqlite3.connect(temp_path, isolation_level=None)
+    try:
+        # The online backup API copies a consistent image while the app keeps writing
+        source.backup(target)
+        source.close()
+        target.execute("PRAGMA journal_mode = DELETE")
+
+        target.execute("BEGIN")
+        for table in PER_NODE_TABLES:
+            target.execute(f'DELETE FROM "{table}"')
+
+        target.execute("DROP TABLE IF EXISTS asset_manifest")
+        target.execute(MANIFEST_DDL)
+        manifest = []
+        missing = 0
+        for path in sorted(set(_asset_paths(target))):
+            try:
+                manifest.append((path, os.path.getsize(os.path.join(app.static_folder, path))))
+            except OSError:
+                missing += 1
+        target.executemany("INSERT INTO asset_manifest (path, bytes) VALUES (?, ?)", manifest)
+        if missing:
+            logging.warning(f"{missing} assets referenced by the catalog are missing from {app.static_folder}")
+
+        version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + uuid.uuid4().hex[:8]
+        meta = {
+            "snapshot_version": version,
+            "snapshot_built_at": datetime.now(timezone.utc).isoformat(),
+            # Caches in the serving processes are keyed on this
+            "catalog_version": version,
+        }
+        target.executemany(
+            "INSERT INTO catalog_meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            list(meta.items()),
+        )
+        target.execute("COMMIT")
+
+        logging.info("Compacting snapshot...")
+        target.execute("VACUUM")
+        # VACUUM may renumber card rowids, which the external-content FTS index refers to
+        target.execute("INSERT INTO card_fts (card_fts) VALUES ('rebuild')")
+        target.execute("INSERT INTO card_fts (card_fts) VALUES ('optimize')")
+        target.execute("ANALYZE")
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+        if check != "ok":
+            raise RuntimeError(f"Snapshot failed its integrity check: {check}")
+    except Exception:
+        target.close()
+        os.remove(temp_path)
+        raise
+    target.close()
+
+    os.chmod(temp_path, 0o444)
+    os.replace(temp_path, output)
+    logging.info(
+        f"Built snapshot {version} at {output} ({os.path.getsize(output) // (1024 * 1024)} MiB, "
+        f"{len(manifest)} assets) in {time.monotonic() - started:.1f}s"
+    )
+    return version
+
+
+class SnapshotSource:
+    """Which file the pool's connections open; swapped when SNAPSHOT_PATH changes"""
+
+    def __init__(self, app):
+        self.path = app.config["SNAPSHOT_PATH"]
+        self.mmap_size = app.config["SNAPSHOT_MMAP_SIZE"]
+        self.cache_size = app.config["SQLITE_CACHE_SIZE"]
+        self.check_interval = app.config["SNAPSHOT_CHECK_INTERVAL"]
+        self.lock = threading.Lock()
+        self.checked_at = time.monotonic()
+        self.current = self._resolve()  # (real path, inode, mtime)
+        self.rejected = None
+
+    def _resolve(self):
+        real_path = os.path.realpath(self.path)
+        stat = os.stat(real_path)
+        return real_path, stat.st_ino, stat.st_mtime_ns
+
+    def _open(self, real_path):
+        conn = sqlite3.connect(
+            f"file:{quote(real_path)}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_size}")
+        conn.execute(f"PRAGMA cache_size = -{self.cache_size}")  # negative: KiB
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def connect(self):
+        return self._open(self.current[0])
+
+    def snapshot_version(self, real_path):
+        conn = self._open(real_path)
+        try:
+            row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'snapshot_version'").fetchone()
+        finally:
+            conn.close()
+        if not row:
+            raise ValueError("not a snapshot (no snapshot_version)")
+        return row[0]
+
+    def check(self, on_swap):
+        """Swap to a new snapshot if SNAPSHOT_PATH now points at one; True if swapped"""
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return False
+        with self.lock:
+            if now - self.checked_at < self.check_interval:
+                return False
+            self.checked_at = now
+            try:
+                candidate = self._resolve()
+            except OSError as e:
+                logging.error(f"Snapshot {self.path} is unreadable, still serving the old one: {e}")
+                return False
+            if candidate == self.current or candidate == self.rejected:
+                return False
+            try:
+                version = self.snapshot_version(candidate[0])
+            except (sqlite3.Error, ValueError) as e:
+                logging.error(f"Not switching to {candidate[0]}: {e}")
+                self.rejected = candidate
+                return False
+            self.current = candidate
+        on_swap()
+        logging.info(f"Switched to catalog snapshot {version} ({candidate[0]})")
+        return True
+
+
+def configure_snapshot(app):
+    """Point the app at SNAPSHOT_PATH, read-only; call before db.init_app"""
+    path = app.config["SNAPSHOT_PATH"]
+    if not path:
+        return None
+    source = SnapshotSource(app)
+    app.extensions["catalog_snapshot"] = source
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.abspath(path)}"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = dict(app.config["SQLALCHEMY_ENGINE_OPTIONS"], creator=source.connect)
+    # The snapshot is the whole catalog; nothing is fetched, downloaded or stored
+    app.config["SCRYFALL_FALLBACK"] = False
+    app.config["CACHE_IMAGES"] = False
+    app.config["SET_SYNC_ON_STARTUP"] = "off"
+    app.config["SYMBOLOGY_TTL"] = float("inf")
+    logging.info(f"Serving read-only catalog snapshot {source.current[0]}")
+    return source
+
+
+def watch_snapshot(app, on_swap):
+    """Check for a new snapshot at the start of requests (at most once per interval)"""
+    source = app.extensions.get("catalog_snapshot")
+    if source is None:
+        return
+
+    def swap():
+        # Checked-out connections finish on the old file; new ones open the new one
+        db.engine.dispose()
+        on_swap()
+
+    @app.before_request
+    def check_catalog_snapshot():
+        source.check(swap)
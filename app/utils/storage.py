@@ -0,0 +1,166 @@
+"""SQLite connection tuning and the per-process write queue.
+
+Every pooled connection runs in WAL mode: readers see a consistent
+snapshot and never wait for a writer, and a writer never waits for
+readers. busy_timeout makes writers in other processes (gunicorn workers,
+CLI imports) wait their turn instead of failing with "database is locked".
+
+Cache-fill writes made while serving requests (Scryfall pages, image and
+icon paths, HTTP cache entries) don't commit on the request thread. They
+are queued to one writer thread per process, which runs whatever is
+queued in a single BEGIN IMMEDIATE transaction, one savepoint per job.
+
+A node serving a read-only snapshot (SNAPSHOT_PATH, see snapshot.py)
+opens its own connections and has no writer thread: writes fail with
+ReadOnlyCatalog.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+from sqlalchemy import event
+
+from ..models import db
+
+
+def _apply_pragmas(app):
+    config = app.config
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {config['SQLITE_BUSY_TIMEOUT']}")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        # Durable at every checkpoint; a power cut can only lose the last commits
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.execute(f"PRAGMA mmap_size = {config['SQLITE_MMAP_SIZE']}")
+        cursor.execute(f"PRAGMA cache_size = -{config['SQLITE_CACHE_SIZE']}")  # negative: KiB
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.close()
+
+    return on_connect
+
+
+class ReadOnlyCatalog(RuntimeError):
+    """A write was attempted while serving a read-only snapshot"""
+
+
+def init_storage(app):
+    """Tune every SQLite connection the app opens; call before the first query"""
+    if db.engine.dialect.name != "sqlite" or app.config["SNAPSHOT_PATH"]:
+        return
+    event.listen(db.engine, "connect", _apply_pragmas(app))
+
+
+class WriteQueue:
+    """Single writer thread that batches queued jobs into one transaction
+
+    A job is a function that writes through db.session without
+    committing. Its Future resolves once the batch it ran in commits.
+    """
+
+    def __init__(self, app, batch_size, batch_delay):
+        self.app = app
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.jobs.put((fn, args, future))
+        return future
+
+    def close(self, timeout=30):
+        """Write out everything queued so far and stop the thread"""
+        if self.thread.is_alive():
+            self.jobs.put(None)
+            self.thread.join(timeout)
+
+    def _next_batch(self):
+        job = self.jobs.get()
+        if job is None:
+            return None
+        batch = [job]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            try:
+                job = self.jobs.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if job is None:
+                self.jobs.put(None)  # Stop after this batch
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            with self.app.app_context():
+                self._write(batch)
+
+    def _write(self, batch):
+        session = db.session
+        results = []
+        try:
+            # Take the write lock up front so the batch can't fail halfway
+            # through on a read-to-write upgrade
+            session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                try:
+                    with session.begin_nested():
+                        results.append((future, fn(*args), None))
+                except Exception as e:
+                    logging.error(f"Write job {fn.__name__} failed: {e}")
+                    results.append((future, None, e))
+            session.commit()
+        except Exception as e:
+            logging.error(f"Write batch of {len(batch)} jobs failed: {e}")
+            session.rollback()
+            results = [(future, None, e) for _, _, future in batch]
+        finally:
+            session.remove()
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_write_queue = None
+_write_queue_pid = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue(app):
+    """The per-process write queue, created lazily so forked workers get their own thread"""
+    global _write_queue, _write_queue_pid
+    with _write_queue_lock:
+        if _write_queue is None or _write_queue_pid != os.getpid():
+            _write_queue = WriteQueue(app, app.config["WRITE_BATCH_SIZE"], app.config["WRITE_BATCH_DELAY"])
+            _write_queue_pid = os.getpid()
+        return _write_queue
+
+
+def queue_write(fn, *args):
+    """Run fn(*args) on the writer thread; returns a Future for its result"""
+    app = current_app._get_current_object()
+    if app.config["SNAPSHOT_PATH"]:
+        future = Future()
+        future.set_exception(ReadOnlyCatalog(f"{fn.__name__}: the catalog is a read-only snapshot"))
+        return future
+    return get_write_queue(app).submit(fn, *args)
+
+
+def run_write(fn, *args, timeout=60):
+    """Run fn(*args) on the writer thread and wait until it is committed"""
+    return queue_write(fn, *args).result(timeout)
@@ -0,0 +1,122 @@
+import functools
+import logging
+import os
+import re
+import threading
+import time
+
+from markupsafe import Markup, escape
+
+from ..models import db, ManaSymbol
+from .assets import download_file
+from .http_cache import api_url, cached_get
+from .storage import run_write
+
+SYMBOL_RE = re.compile(r"\{.*?\}")
+ICON_TAG = '<img src="{url}" alt="{symbol}" style="width:20px; height:20px; vertical-align:middle;">'
+
+# In-process copy of the mana_symbol table: symbol -> path under static/
+_icons = {}
+_loaded_at = 0.0
+_refresh_lock = threading.Lock()
+
+
+def load_mana_icons():
+    """(Re)load the symbol table from the database into the in-process cache"""
+    global _icons, _loaded_at
+    _icons = {row.symbol: row.local_path for row in ManaSymbol.query.all() if row.local_path}
+    _loaded_at = time.monotonic()
+    _render_symbols.cache_clear()
+    return _icons
+
+
+def get_mana_icons(app=None):
+    """Current symbol -> icon path map; schedules a background refresh once stale"""
+    if app is not None and time.monotonic() - _loaded_at > app.config["SYMBOLOGY_TTL"]:
+        start_background_refresh(app)
+    return _icons
+
+
+def _icon_filename(symbol_code):
+    # Clean the symbol for filename, e.g. {R} -> R, {2} -> 2, {W/U} -> WU, etc.
+    return symbol_code.replace("{", "").replace("}", "").replace("/", "").replace(" ", "") + ".svg"
+
+
+def refresh_mana_icons(app):
+    """Sync the symbol table with Scryfall, downloading any missing SVGs"""
+    # Always revalidates; an unchanged list comes back from the cache via 304
+    response = cached_get(api_url("/symbology"), ttl=0)
+    if response.status_code != 200:
+        logging.error(f"Failed to fetch symbology: {response.status_code}")
+        return _icons
+
+    save_dir = os.path.join(app.static_folder, "mana")
+    os.makedirs(save_dir, exist_ok=True)
+    rows = []
+    for symbol in response.json().get("data", []):
+        symbol_code = symbol["symbol"]  # e.g. "{R}", "{2}"
+        filename = _icon_filename(symbol_code)
+        save_path = os.path.join(save_dir, filename)
+        local_path = f"mana/{filename}"
+        if not download_file(symbol["svg_uri"], save_path):
+            local_path = None
+        rows.append({"symbol": symbol_code, "svg_uri": symbol["svg_uri"], "local_path": local_path})
+
+    run_write(_store_symbols, rows)
+    logging.info("Refreshed mana symbols from Scryfall")
+    return load_mana_icons()
+
+
+def _store_symbols(rows):
+    for row in rows:
+        db.session.merge(ManaSymbol(**row))
+
+
+def _refresh_in_background(app):
+    global _loaded_at
+    try:
+        with app.app_context():
+            refresh_mana_icons(app)
+    except Exception as e:
+        logging.error(f"Error refreshing mana symbols: {e}")
+        _loaded_at = time.monotonic()  # Retry after another TTL, not on every request
+    finally:
+        _refresh_lock.release()
+
+
+def start_background_refresh(app):
+    """Refresh the symbol table in a daemon thread unless one is already running"""
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    threading.Thread(target=_refresh_in_background, args=(app,), name="symbology-refresh", daemon=True).start()
+    return True
+
+
+def init_mana_icons(app):
+    """Load symbols at startup; fetch them in the background if the table is empty"""
+    load_mana_icons()
+    if not _icons and not app.config["SNAPSHOT_PATH"]:
+        start_background_refresh(app)
+
+
+@functools.lru_cache(maxsize=4096)
+def _render_symbols(text, static_url):
+    # Escape the surrounding text and swap every known symbol for its icon
+    parts = []
+    position = 0
+    for match in SYMBOL_RE.finditer(text):
+        symbol = match.group(0)
+        parts.append(escape(text[position:match.start()]))
+        icon_path = _icons.get(symbol)
+        if icon_path:
+            parts.append(ICON_TAG.format(url=static_url + icon_path, symbol=escape(symbol)))
+        else:
+            parts.append(escape(symbol))
+        position = match.end()
+    parts.append(escape(text[position:]))
+    return "".join(parts)
+
+
+def render_symbols(text, static_url):
+    """HTML for mana costs and rules text with inline symbol icons, memoized per string"""
+    return Markup(_render_symbols(text or "", static_url))
@@ -0,0 +1,236 @@
+"""Guards around outbound HTTP so a slow Scryfall can't tie up web workers.
+
+Every call through the shared session (assets.get_http_session) is
+checked against a per-host guard:
+- at most UPSTREAM_HOST_CONCURRENCY requests in flight per host; a
+  request that can't get a slot within UPSTREAM_QUEUE_TIMEOUT fails
+- a circuit breaker: UPSTREAM_BREAKER_THRESHOLD consecutive failures
+  (connection errors, timeouts, 5xx, 429) open it for
+  UPSTREAM_BREAKER_COOLDOWN seconds, during which calls fail at once;
+  after that one trial call decides whether it closes again
+Refused calls raise UpstreamUnavailable, a requests.ConnectionError, so
+callers take their existing "Scryfall unreachable" path (stale cache or
+local-only results).
+
+Request handlers don't call Scryfall themselves. They hand the work to a
+small per-process pool (fetch_with_budget) and wait at most
+UPSTREAM_WAIT_BUDGET seconds. If the work takes longer, the page is
+served from local data and the fetch finishes in the background, so the
+cards are there for the next request. prefetch() queues speculative work
+(the next result page) only while the pool has idle workers.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import requests
+
+from .metrics import UPSTREAM_SHED, UPSTREAM_WAITS
+
+# Statuses that mean the host is struggling, as opposed to "no such card"
+FAILURE_STATUSES = (429, 500, 502, 503, 504)
+
+_settings = {
+    "concurrency": 8,
+    "queue_timeout": 0.5,
+    "breaker_threshold": 5,
+    "breaker_cooldown": 30.0,
+}
+
+
+class UpstreamUnavailable(requests.ConnectionError):
+    """The call was refused locally: circuit open or host saturated"""
+
+
+class HostGuard:
+    """Concurrency limit and circuit breaker for one host"""
+
+    def __init__(self, host, concurrency, threshold, cooldown):
+        self.host = host
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown
+
+    def _admit(self):
+        """(allowed, is_trial) for a new call"""
+        with self.lock:
+            if self.opened_at is None:
+                return True, False
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial_running:
+                return False, False
+            # Half-open: let one call through to test the host
+            self.trial_running = True
+            return True, True
+
+    def acquire(self, queue_timeout):
+        allowed, trial = self._admit()
+        if not allowed:
+            UPSTREAM_SHED.inc(host=self.host, reason="circuit_open")
+            raise UpstreamUnavailable(f"{self.host}: circuit open after repeated failures")
+        if not self.slots.acquire(timeout=queue_timeout):
+            if trial:
+                with self.lock:
+                    self.trial_running = False
+            UPSTREAM_SHED.inc(host=self.host, reason="saturated")
+            raise UpstreamUnavailable(f"{self.host}: too many requests in flight")
+
+    def release(self, ok):
+        self.slots.release()
+        with self.lock:
+            self.trial_running = False
+            if ok:
+                if self.opened_at is not None:
+                    logging.info(f"Upstream {self.host} recovered, closing circuit")
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logging.warning(f"Upstream {self.host} failed {self.failures} times in a row, "
+                                    f"pausing calls for {self.cooldown:.0f}s")
+                self.opened_at = time.monotonic()
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def host_guard(host):
+    with _guards_lock:
+        guard = _guards.get(host)
+        if guard is None:
+            guard = _guards[host] = HostGuard(
+                host,
+                _settings["concurrency"],
+                _settings["breaker_threshold"],
+                _settings["breaker_cooldown"],
+            )
+        return guard
+
+
+def guarded_send(host, send):
+    """Run send() (one HTTP exchange with host) under the host's guard"""
+    guard = host_guard(host)
+    guard.acquire(_settings["queue_timeout"])
+    ok = False
+    try:
+        response = send()
+        ok = response.status_code not in FAILURE_STATUSES
+        return response
+    finally:
+        guard.release(ok)
+
+
+def upstream_available(host):
+    """False while the host's circuit is open"""
+    guard = _guards.get(host)
+    return guard is None or not guard.is_open()
+
+
+class FetchPool:
+    """Bounded pool for upstream work started by requests; jobs are deduplicated by key"""
+
+    def __init__(self, app, max_workers):
+        self.app = app
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upstream")
+        self.pending = {}  # key -> Future
+        self.lock = threading.Lock()
+
+    def submit(self, key, fn, *args, speculative=False):
+        """Future for fn(*args), shared with an identical job in flight; None if skipped"""
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                return future
+            # Speculative work must never queue behind (or ahead of) real work
+            if speculative and len(self.pending) >= self.max_workers:
+                return None
+            # Real work queues at most one round deep; past that the caller serves local data
+            if len(self.pending) >= self.max_workers * 2:
+                return None
+            future = self.pending[key] = self.executor.submit(self._run, key, fn, args)
+            return future
+
+    def _run(self, key, fn, args):
+        try:
+            with self.app.app_context():
+                return fn(*args)
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def configure_upstream(app):
+    """Apply the UPSTREAM_* settings; call once from create_app"""
+    config = app.config
+    _settings.update(
+        concurrency=config["UPSTREAM_HOST_CONCURRENCY"],
+        queue_timeout=config["UPSTREAM_QUEUE_TIMEOUT"],
+        breaker_threshold=config["UPSTREAM_BREAKER_THRESHOLD"],
+        breaker_cooldown=config["UPSTREAM_BREAKER_COOLDOWN"],
+    )
+
+
+def get_fetch_pool(app):
+    """The per-process pool, created lazily so forked workers get their own threads"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = FetchPool(app, app.config["UPSTREAM_WORKERS"])
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def fetch_with_budget(app, key, fn, *args):
+    """fn(*args) from the fetch pool if it finishes within UPSTREAM_WAIT_BUDGET, else None
+
+    Work that overruns the budget keeps running; its results land in the
+    database for later requests.
+    """
+    future = get_fetch_pool(app).submit(key, fn, *args)
+    if future is None:
+        UPSTREAM_WAITS.inc(result="skipped")
+        return None
+    try:
+        result = future.result(timeout=app.config["UPSTREAM_WAIT_BUDGET"])
+    except FutureTimeout:
+        UPSTREAM_WAITS.inc(result="budget")
+        logging.info(f"Upstream work {key} is over budget, serving local results")
+        return None
+    except Exception as e:
+        UPSTREAM_WAITS.inc(result="error")
+        logging.warning(f"Upstream work {key} failed: {e}")
+        return None
+    UPSTREAM_WAITS.inc(result="done")
+    return result
+
+
+def prefetch(app, key, fn, *args):
+    """Start fn(*args) in the background if a fetch worker is idle"""
+    future = get_fetch_pool(app).submit(key, fn, *args, speculative=True)
+    if future is not None:
+        future.add_done_callback(_log_prefetch_error)
+    return future is not None
+
+
+def _log_prefetch_error(future):
+    error = future.exception()
+    if error is not None:
+        logging.debug(f"Prefetch failed: {error}")
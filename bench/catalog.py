@@ -0,0 +1,271 @@
+"""Deterministic synthetic Scryfall catalog for benchmarks.
+
+Cards are shaped like Scryfall API card objects (colors, type lines, mana
+costs, legalities, double-faced cards, ...) so they go through the real
+importer. Printings per oracle card follow a long tail: most cards have a
+handful of printings, basic lands have hundreds.
+
+    python -m bench.catalog --cards 100000 --db bench/data/catalog.db
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+
+SEED = 20240601
+# Nothing listens here: startup tasks that call Scryfall (the symbology
+# refresh) fail at once instead of going out to api.scryfall.com
+OFFLINE_API_URL = "http://127.0.0.1:9"
+COLORS = ["W", "U", "B", "R", "G"]
+RARITIES = ["common", "uncommon", "rare", "mythic"]
+SET_TYPES = ["core", "expansion", "masters", "commander", "draft_innovation", "funny"]
+FORMATS = [
+    "standard", "future", "historic", "timeless", "gladiator", "pioneer", "explorer",
+    "modern", "legacy", "pauper", "vintage", "penny", "commander", "oathbreaker",
+    "standardbrawl", "brawl", "alchemy", "paupercommander", "duel", "oldschool", "premodern",
+]
+SUBTYPES = [
+    "Goblin", "Elf", "Wizard", "Human", "Soldier", "Zombie", "Dragon", "Angel", "Merfolk",
+    "Vampire", "Beast", "Knight", "Spirit", "Warrior", "Cleric", "Rogue", "Shaman", "Golem",
+]
+SYLLABLES = [
+    "ar", "bel", "cor", "dra", "el", "fen", "gor", "hal", "ith", "jor", "kal", "lum",
+    "mor", "nal", "or", "pyr", "quel", "ros", "syl", "thar", "ul", "vor", "wyn", "xan", "zed",
+]
+NOUNS = [
+    "Bolt", "Guide", "Oracle", "Titan", "Rebuke", "Harvest", "Sentinel", "Revenant",
+    "Tempest", "Archon", "Ritual", "Covenant", "Wurm", "Familiar", "Mirage", "Vanguard",
+]
+RULES = [
+    "Flying", "Haste", "Trample", "Vigilance", "Deathtouch", "Lifelink", "First strike",
+    "When {name} enters the battlefield, draw a card.",
+    "{name} deals 3 damage to any target.",
+    "{T}: Add {C}.",
+    "{1}{C0}, {T}: Target creature gets +2/+2 until end of turn.",
+    "Counter target spell unless its controller pays {3}.",
+    "Destroy target creature. Its controller gains life equal to its power.",
+    "At the beginning of your upkeep, you may search your library for a basic land card.",
+    "Whenever another creature you control dies, create a 1/1 black Zombie creature token.",
+    "Return target card from your graveyard to your hand.",
+]
+BASIC_LANDS = {"Plains": "W", "Island": "U", "Swamp": "B", "Mountain": "R", "Forest": "G"}
+
+
+def make_sets(count, rng):
+    sets = []
+    codes = set()
+    for i in range(count):
+        code = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(3))
+        while code in codes:
+            code = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(3))
+        codes.add(code)
+        year = 1993 + i * 32 // count
+        sets.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "code": code,
+            "name": f"{rng.choice(SYLLABLES).capitalize()}{rng.choice(SYLLABLES)} {rng.choice(NOUNS)}s",
+            "released_at": f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "set_type": rng.choice(SET_TYPES),
+            "icon_svg_uri": None,
+        })
+    return sets
+
+
+def _name(rng, used):
+    while True:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+        name = f"{word} {rng.choice(NOUNS)}" if rng.random() < 0.7 else word
+        if name not in used:
+            used.add(name)
+            return name
+
+
+def _mana_cost(rng, colors, cmc):
+    symbols = [f"{{{c}}}" for c in colors]
+    generic = max(0, cmc - len(symbols))
+    return (f"{{{generic}}}" if generic else "") + "".join(symbols), max(cmc, len(symbols))
+
+
+def _face(rng, name, colors):
+    kind = rng.choices(
+        ["Creature", "Instant", "Sorcery", "Enchantment", "Artifact", "Artifact Creature", "Planeswalker", "Land"],
+        weights=[40, 12, 12, 10, 8, 6, 3, 9],
+    )[0]
+    if kind == "Land":
+        colors = []
+    legendary = "Legendary " if rng.random() < 0.1 or kind == "Planeswalker" else ""
+    type_line = f"{legendary}{kind}"
+    if "Creature" in kind:
+        type_line += " — " + " ".join(rng.sample(SUBTYPES, rng.randint(1, 2)))
+    cmc = 0 if kind == "Land" else rng.randint(1, 7)
+    mana_cost, cmc = _mana_cost(rng, colors, cmc) if kind != "Land" else ("", 0)
+    color_symbol = colors[0] if colors else "C"
+    text = "\n".join(
+        rule.replace("{name}", name).replace("{C0}", f"{{{color_symbol}}}")
+        for rule in rng.sample(RULES, rng.randint(1, 3))
+    )
+    face = {
+        "name": name,
+        "mana_cost": mana_cost,
+        "type_line": type_line,
+        "oracle_text": text,
+        "colors": colors,
+    }
+    if "Creature" in kind:
+        face["power"] = str(rng.randint(0, 8))
+        face["toughness"] = str(rng.randint(1, 8))
+    if kind == "Planeswalker":
+        face["loyalty"] = str(rng.randint(2, 6))
+    return face, cmc
+
+
+def make_oracle_card(rng, used_names):
+    """One card's rules (everything printings share)"""
+    ncolors = rng.choices([0, 1, 2, 3, 5], weights=[12, 60, 22, 5, 1])[0]
+    colors = sorted(rng.sample(COLORS, ncolors), key=COLORS.index)
+    oracle = {"oracle_id": str(uuid.UUID(int=rng.getrandbits(128)))}
+    if rng.random() < 0.03:
+        front, cmc = _face(rng, _name(rng, used_names), colors)
+        back, _ = _face(rng, _name(rng, used_names), colors)
+        back["mana_cost"] = ""
+        oracle.update({
+            "name": f"{front['name']} // {back['name']}",
+            "layout": "transform",
+            "cmc": float(cmc),
+            "type_line": f"{front['type_line']} // {back['type_line']}",
+            "card_faces": [front, back],
+            "colors": colors,
+        })
+    else:
+        face, cmc = _face(rng, _name(rng, used_names), colors)
+        oracle.update(face)
+        oracle.update({"layout": "normal", "cmc": float(cmc)})
+    identity = set(oracle.get("colors") or [])
+    for symbol in COLORS:
+        if f"{{{symbol}}}" in oracle.get("oracle_text", ""):
+            identity.add(symbol)
+    oracle["color_identity"] = sorted(identity, key=COLORS.index)
+    oracle["legalities"] = {
+        fmt: rng.choices(["legal", "not_legal", "banned", "restricted"], weights=[60, 36, 3, 1])[0]
+        for fmt in FORMATS
+    }
+    return oracle
+
+
+def basic_land(name, color):
+    return {
+        "oracle_id": str(uuid.uuid5(uuid.NAMESPACE_URL, name)),
+        "name": name,
+        "layout": "normal",
+        "cmc": 0.0,
+        "mana_cost": "",
+        "type_line": f"Basic Land — {name}",
+        "oracle_text": f"({{T}}: Add {{{color}}}.)",
+        "colors": [],
+        "color_identity": [color],
+        "legalities": {fmt: "legal" for fmt in FORMATS},
+    }
+
+
+def make_printing(rng, oracle, card_set, collector_number, image_base):
+    card_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    card = dict(oracle)
+    card.update({
+        "object": "card",
+        "id": card_id,
+        "lang": "en" if rng.random() < 0.9 else rng.choice(["ja", "de", "fr"]),
+        "set": card_set["code"],
+        "set_name": card_set["name"],
+        "released_at": card_set["released_at"],
+        "collector_number": str(collector_number),
+        "rarity": rng.choice(RARITIES),
+        "scryfall_uri": f"https://scryfall.com/card/{card_set['code']}/{collector_number}",
+        "rulings_uri": f"https://api.scryfall.com/cards/{card_id}/rulings",
+        "prints_search_uri": f"https://api.scryfall.com/cards/search?q=oracleid%3A{oracle['oracle_id']}&unique=prints",
+        "image_uris": {"normal": f"{image_base}/images/{card_id}.jpg"},
+    })
+    return card
+
+
+def generate_cards(count, sets, seed=SEED, image_base="http://127.0.0.1:8799"):
+    """Yield `count` printings spread over the given sets"""
+    rng = random.Random(seed)
+    used_names = set()
+    numbers = {card_set["code"]: 0 for card_set in sets}
+    emitted = 0
+
+    def printing(oracle):
+        card_set = rng.choice(sets)
+        numbers[card_set["code"]] += 1
+        return make_printing(rng, oracle, card_set, numbers[card_set["code"]], image_base)
+
+    # Basic lands are the most reprinted cards: about 0.5% of the catalog each
+    for name, color in BASIC_LANDS.items():
+        oracle = basic_land(name, color)
+        for _ in range(max(1, count // 200)):
+            if emitted == count:
+                return
+            yield printing(oracle)
+            emitted += 1
+
+    while emitted < count:
+        oracle = make_oracle_card(rng, used_names)
+        reprints = min(int(rng.paretovariate(1.6)), 40)
+        for _ in range(reprints):
+            if emitted == count:
+                return
+            yield printing(oracle)
+            emitted += 1
+
+
+def build_catalog(cards=100000, sets=400, seed=SEED):
+    """Fill the configured database (DB_PATH) with a synthetic catalog"""
+    from app import create_app
+    from app.models import db, ManaSymbol, Set
+    from app.utils.catalog import mark_bulk_imported
+    from app.utils.importer import CardBatchWriter
+
+    app = create_app()
+    rng = random.Random(seed)
+    set_rows = make_sets(sets, rng)
+    with app.app_context():
+        db.session.execute(db.insert(Set), [{k: v for k, v in row.items() if k != "icon_svg_uri"} for row in set_rows])
+        # Symbol rows without files: templates render icons and nothing is fetched
+        symbols = COLORS + ["C", "T", "X"] + [str(n) for n in range(11)]
+        db.session.execute(db.insert(ManaSymbol), [
+            {"symbol": f"{{{symbol}}}", "svg_uri": None, "local_path": f"mana/{symbol}.svg"} for symbol in symbols
+        ])
+        db.session.commit()
+        writer = CardBatchWriter(db.session)
+        for card in generate_cards(cards, set_rows, seed):
+            writer.add(card)
+        writer.flush()
+        mark_bulk_imported("bench-synthetic")
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=100000)
+    parser.add_argument("--sets", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--db", default=os.path.join("bench", "data", "catalog.db"))
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ["DB_PATH"] = db_path
+    os.environ["SCRYFALL_API_URL"] = OFFLINE_API_URL
+    os.environ.setdefault("SET_SYNC_ON_STARTUP", "off")
+    os.environ.setdefault("CACHE_IMAGES", "0")
+
+    started = time.perf_counter()
+    build_catalog(args.cards, args.sets, args.seed)
+    print(f"Built {args.cards} cards in {time.perf_counter() - started:.1f}s -> {db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Benchmark runner: times the hot paths against a synthetic catalog, offline.
+
+The catalog (bench/data/catalog.db, built on first use) is copied to a
+scratch database for each run, and a stub Scryfall server is started on
+a free port, so runs are repeatable and never touch the network or the
+real data/cards.db.
+
+    python -m bench.run                      # JSON results on stdout
+    python -m bench.run -o results.json      # ... or to a file
+    python -m bench.run --compare base.json  # p50 ratios against an earlier run
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+
+from . import catalog
+from .stub_scryfall import SEARCH_PAGES, start_stub
+
+SEARCH_QUERIES = [
+    "bolt",
+    "t:goblin c:r",
+    "t:creature (c:r or c:g) cmc<=2",
+    "f:modern id<=wu t:instant",
+    'o:"draw a card" -t:land',
+    "pow>=5 r>=rare",
+    "unique:cards t:creature",
+]
+PAGINATION_QUERY = "t:creature"
+
+
+def _stats(samples):
+    samples = sorted(samples)
+    ms = [s * 1000 for s in samples]
+    return {
+        "n": len(ms),
+        "min_ms": round(ms[0], 3),
+        "p50_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return _stats(samples)
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_database(catalog_path, scratch_path, cards):
+    """Build the catalog once, then give this run its own copy of it"""
+    if not os.path.exists(catalog_path):
+        print(f"Building {cards}-card catalog at {catalog_path} (one-off)...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, "-m", "bench.catalog", "--cards", str(cards), "--db", catalog_path],
+            check=True, env=dict(os.environ, SET_SYNC_ON_STARTUP="off", CACHE_IMAGES="0"),
+        )
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(scratch_path + suffix):
+            os.remove(scratch_path + suffix)
+    source = sqlite3.connect(catalog_path)
+    target = sqlite3.connect(scratch_path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+def bench_search(app, repeat):
+    from app.utils.helpers import fetch_and_cache_cards
+
+    results = {}
+    with app.app_context():
+        for query in SEARCH_QUERIES:
+            results[f"search[{query}]"] = measure(lambda: fetch_and_cache_cards(search_string=query), repeat)
+    return results
+
+
+def bench_pagination(app, pages):
+    """Walk the cursor chain, then compare a deep page reached by offset"""
+    from app.utils.helpers import fetch_card_page
+
+    results = {}
+    with app.app_context():
+        samples = []
+        cursor = None
+        for _ in range(pages):
+            started = time.perf_counter()
+            page = fetch_card_page(search_string=PAGINATION_QUERY, cursor=cursor)
+            samples.append(time.perf_counter() - started)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        results["pagination.cursor_walk"] = _stats(samples)
+        results["pagination.cursor_walk"]["pages"] = len(samples)
+        results["pagination.last_cursor_page"] = {"ms": round(samples[-1] * 1000, 3)}
+        results[f"pagination.offset_page_{len(samples)}"] = measure(
+            lambda: fetch_card_page(search_string=PAGINATION_QUERY, page=len(samples)), 5
+        )
+    return results
+
+
+def bench_card_detail(app, repeat):
+    from app.models import db, Card
+
+    with app.app_context():
+        most_reprinted = db.session.execute(db.text(
+            "SELECT oracle_id, count(*) FROM card GROUP BY oracle_id ORDER BY 2 DESC LIMIT 1"
+        )).first()
+        heavy = db.session.query(Card.id).filter(Card.oracle_id == most_reprinted[0]).first()[0]
+        typical = db.session.execute(db.text(
+            "SELECT id FROM card WHERE oracle_id IN "
+            "(SELECT oracle_id FROM card GROUP BY oracle_id HAVING count(*) BETWEEN 3 AND 5) LIMIT 1"
+        )).scalar()
+
+    client = app.test_client()
+    results = {}
+    for label, card_id in (("typical", typical), ("most_reprinted", heavy)):
+        started = time.perf_counter()
+        assert client.get(f"/card/{card_id}").status_code == 200
+        first = time.perf_counter() - started
+        results[f"card_detail.{label}"] = measure(lambda: client.get(f"/card/{card_id}"), repeat, warmup=0)
+        results[f"card_detail.{label}"]["first_ms"] = round(first * 1000, 3)
+    results["card_detail.most_reprinted"]["printings"] = most_reprinted[1]
+    return results
+
+
+def bench_sets(app, repeat):
+    client = app.test_client()
+    return {
+        "sets.by_name": measure(lambda: client.get("/sets"), repeat),
+        "sets.by_date_desc": measure(lambda: client.get("/sets?sort=date&direction=desc"), repeat),
+    }
+
+
+def bench_card_grid(app, repeat):
+    from flask import render_template
+
+    from app.models import Card
+
+    with app.test_request_context("/"):
+        cards = Card.query.order_by(Card.name, Card.id).limit(20).all()
+        return {"render.card_grid_20": measure(
+            lambda: render_template("partials/card_grid.html", cards=cards, next_cursor="x"), repeat
+        )}
+
+
+def bench_ingest(app):
+    """Fetch every stub search page through the HTTP cache and ingest it"""
+    from sqlalchemy import event
+
+    from app.models import db
+    from app.utils.http_cache import api_url, cached_get
+    from app.utils.importer import ingest_scryfall_cards
+    from app.utils.storage import run_write
+
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", count)
+        fetch_time = ingest_time = 0.0
+        inserted = pages = 0
+        for page in range(1, SEARCH_PAGES + 1):
+            started = time.perf_counter()
+            data = cached_get(api_url("/cards/search"), params={"q": "bench ingest", "page": page}).json()
+            fetch_time += time.perf_counter() - started
+            statements[0] = 0
+            started = time.perf_counter()
+            inserted += run_write(ingest_scryfall_cards, data["data"])
+            ingest_time += time.perf_counter() - started
+            pages += 1
+        event.remove(db.engine, "before_cursor_execute", count)
+    return {"ingest.search_pages": {
+        "pages": pages,
+        "cards": inserted,
+        "fetch_ms": round(fetch_time * 1000, 3),
+        "ingest_ms": round(ingest_time * 1000, 3),
+        "cards_per_second": round(inserted / ingest_time, 1) if ingest_time else None,
+        "statements_last_page": statements[0],
+    }}
+
+
+def compare(base, current):
+    """Rows of (name, base p50, current p50, ratio) for benchmarks in both runs"""
+    rows = []
+    for name, result in current["results"].items():
+        before = base["results"].get(name, {})
+        key = "p50_ms" if "p50_ms" in result else "ingest_ms" if "ingest_ms" in result else None
+        if key and key in before and before[key]:
+            rows.append((name, before[key], result[key], result[key] / before[key]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the mtg-db benchmarks offline")
+    parser.add_argument("--cards", type=int, default=100000, help="Catalog size when it has to be built")
+    parser.add_argument("--catalog", default=os.path.join("bench", "data", "catalog.db"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=500, help="Cursor pages to walk")
+    parser.add_argument("-o", "--output", help="Write results here instead of stdout")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's INFO/DEBUG logging")
+    args = parser.parse_args()
+
+    catalog_path = os.path.abspath(args.catalog)
+    scratch_path = os.path.join(os.path.dirname(catalog_path), "run.db")
+    os.makedirs(os.path.dirname(catalog_path), exist_ok=True)
+    prepare_database(catalog_path, scratch_path, args.cards)
+
+    server, stub = start_stub()
+    os.environ.update({
+        "DB_PATH": scratch_path,
+        "SCRYFALL_API_URL": stub.base_url,
+        "SET_SYNC_ON_STARTUP": "off",
+        "CACHE_IMAGES": "0",
+    })
+    from app import create_app
+
+    app = create_app()
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    started = time.perf_counter()
+    results = {}
+    results.update(bench_search(app, args.repeat))
+    results.update(bench_pagination(app, args.pages))
+    results.update(bench_card_detail(app, args.repeat))
+    results.update(bench_sets(app, args.repeat))
+    results.update(bench_card_grid(app, args.repeat))
+    results.update(bench_ingest(app))
+
+    with app.app_context():
+        from app.models import db
+        card_count = db.session.execute(db.text("SELECT count(*) FROM card")).scalar()
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "catalog_cards": card_count,
+            "seed": catalog.SEED,
+            "repeat": args.repeat,
+            "elapsed_s": round(time.perf_counter() - started, 2),
+        },
+        "results": results,
+    }
+    server.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        print(f"{'benchmark':55} {'base':>10} {'now':>10} {'ratio':>7}", file=sys.stderr)
+        for name, before, now, ratio in compare(base, report):
+            print(f"{name:55} {before:10.2f} {now:10.2f} {ratio:7.2f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
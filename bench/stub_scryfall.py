@@ -0,0 +1,185 @@
+"""Offline stand-in for the Scryfall endpoints the app calls.
+
+Serves /sets, /symbology, /cards/search (paged, 175 cards per page like
+Scryfall, with fresh card ids on every page), POST /cards/collection
+(names starting with "Missing" are reported not found), SVG icons and card images,
+all generated from bench.catalog. JSON responses carry an ETag so the
+HTTP cache's revalidation path is exercised too; fail_status makes every
+GET fail, for the cache's stale-on-error path.
+
+    python -m bench.stub_scryfall --port 8799
+    SCRYFALL_API_URL=http://127.0.0.1:8799 flask --app run run
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from . import catalog
+
+PAGE_SIZE = 175
+SEARCH_PAGES = 20
+ICON_SVG = b"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 32 32'><circle cx='16' cy='16' r='14'/></svg>"
+# Placeholder image body (JPEG start/end markers); the benchmarks never decode images
+CARD_JPEG = b"\xff\xd8\xff\xd9"
+
+
+class StubScryfall:
+    """The generated data plus request counters, shared by the handler threads"""
+
+    def __init__(self, seed=catalog.SEED, sets=50, latency=0.0):
+        rng = random.Random(seed)
+        self.base_url = None
+        self.sets = catalog.make_sets(sets, rng)
+        self.seed = seed
+        self.latency = latency
+        self.fail_status = None  # Set to e.g. 503 to make every GET fail
+        self.hits = {}
+        self.conditional_hits = {}  # Requests that sent If-None-Match
+        self.lock = threading.Lock()
+
+    def count(self, path, conditional=False):
+        with self.lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+            if conditional:
+                self.conditional_hits[path] = self.conditional_hits.get(path, 0) + 1
+
+    def sets_payload(self):
+        data = [dict(card_set, icon_svg_uri=f"{self.base_url}/icons/{card_set['code']}.svg") for card_set in self.sets]
+        return {"object": "list", "has_more": False, "data": data}
+
+    def symbology_payload(self):
+        symbols = catalog.COLORS + ["C", "T", "X"] + [str(n) for n in range(11)]
+        data = [{"symbol": f"{{{s}}}", "svg_uri": f"{self.base_url}/icons/symbol-{s}.svg"} for s in symbols]
+        return {"object": "list", "has_more": False, "data": data}
+
+    def search_payload(self, query, page):
+        if page > SEARCH_PAGES:
+            return None
+        # Same query and page -> same cards, so repeated runs are comparable
+        seed = int(hashlib.sha1(f"{self.seed}:{query}:{page}".encode()).hexdigest()[:8], 16)
+        cards = list(catalog.generate_cards(PAGE_SIZE, self.sets, seed=seed, image_base=self.base_url))
+        return {
+            "object": "list",
+            "total_cards": PAGE_SIZE * SEARCH_PAGES,
+            "has_more": page < SEARCH_PAGES,
+            "data": cards,
+        }
+
+    def collection_payload(self, identifiers):
+        data = []
+        not_found = []
+        for identifier in identifiers:
+            name = identifier.get("name") or f"Collector {identifier.get('set')} {identifier.get('collector_number')}"
+            if name.startswith("Missing"):
+                not_found.append(identifier)
+                continue
+            seed = int(hashlib.sha1(f"{self.seed}:{sorted(identifier.items())}".encode()).hexdigest()[:8], 16)
+            rng = random.Random(seed)
+            card_set = next((s for s in self.sets if s["code"] == identifier.get("set")), None) or rng.choice(self.sets)
+            oracle = catalog.make_oracle_card(rng, set())
+            oracle["name"] = name
+            card = catalog.make_printing(rng, oracle, card_set, identifier.get("collector_number") or rng.randint(1, 400),
+                                         self.base_url)
+            data.append(card)
+        return {"object": "list", "not_found": not_found, "data": data}
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            stub.count(url.path, conditional="If-None-Match" in self.headers)
+            if stub.latency:
+                time.sleep(stub.latency)
+            if stub.fail_status:
+                return self.send_json({"object": "error", "status": stub.fail_status}, stub.fail_status)
+            params = parse_qs(url.query)
+            if url.path == "/sets":
+                return self.send_json(stub.sets_payload())
+            if url.path == "/symbology":
+                return self.send_json(stub.symbology_payload())
+            if url.path == "/cards/search":
+                page = int(params.get("page", ["1"])[0])
+                payload = stub.search_payload(params.get("q", [""])[0], page)
+                if payload is None:
+                    return self.send_json({"object": "error", "status": 404, "code": "not_found"}, 404)
+                return self.send_json(payload)
+            if url.path.startswith("/icons/"):
+                return self.send_body(200, ICON_SVG, "image/svg+xml")
+            if url.path.startswith("/images/"):
+                return self.send_body(200, CARD_JPEG, "image/jpeg")
+            if url.path == "/hits":
+                return self.send_json(stub.hits)
+            return self.send_json({"object": "error", "status": 404, "code": "not_found"}, 404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            stub.count(url.path)
+            if stub.latency:
+                time.sleep(stub.latency)
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if url.path == "/cards/collection":
+                identifiers = body.get("identifiers", [])
+                if len(identifiers) > 75:
+                    return self.send_json({"object": "error", "status": 422, "code": "too_many"}, 422)
+                return self.send_json(stub.collection_payload(identifiers))
+            return self.send_json({"object": "error", "status": 404, "code": "not_found"}, 404)
+
+        def send_json(self, payload, status=200):
+            body = json.dumps(payload).encode("utf-8")
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if status == 200 and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_body(status, body, "application/json", etag)
+
+        def send_body(self, status, body, content_type, etag=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def start_stub(port=0, latency=0.0, seed=catalog.SEED):
+    """Serve the stub on a daemon thread; returns (server, stub). port=0 picks a free port."""
+    stub = StubScryfall(seed=seed, latency=latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(stub))
+    server.daemon_threads = True
+    stub.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="stub-scryfall", daemon=True).start()
+    return server, stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Scryfall API stub")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+    server, stub = start_stub(args.port, args.latency)
+    print(f"Stub Scryfall API on {stub.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,89 @@ import os
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
-    DB_PATH = os.path.join(BASE_DIR, 'data', 'cards.db')  # go up from app/ if config is in app/
+    DB_PATH = os.environ.get("DB_PATH", os.path.join(BASE_DIR, 'data', 'cards.db'))  # go up from app/ if config is in app/
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{DB_PATH}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_POOL_OVERFLOW", 10)),
+    }
+
+    # Applied to every SQLite connection on top of WAL mode (app/utils/storage.py)
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 10000))  # ms
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # bytes
+    SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", 64 * 1024))  # KiB per connection
+
+    # Cache-fill writes are committed by one writer thread per process, up to
+    # WRITE_BATCH_SIZE jobs per transaction, waiting WRITE_BATCH_DELAY seconds
+    # for more jobs to arrive
+    WRITE_BATCH_SIZE = 200
+    WRITE_BATCH_DELAY = 0.02
+
+    # Serve a read-only catalog snapshot built by flask build-snapshot
+    # (app/utils/snapshot.py) instead of DB_PATH. The path is re-checked
+    # every SNAPSHOT_CHECK_INTERVAL seconds; replace the file (or repoint a
+    # symlink) atomically to roll out a new catalog without a restart.
+    SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH") or None
+    SNAPSHOT_MMAP_SIZE = int(os.environ.get("SNAPSHOT_MMAP_SIZE", 1024 * 1024 * 1024))  # bytes
+    SNAPSHOT_CHECK_INTERVAL = float(os.environ.get("SNAPSHOT_CHECK_INTERVAL", 5))
+
+    # Per-request timings (db, upstream, render, total) in a Server-Timing
+    # response header; the same numbers are always collected for /metrics
+    SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+
+    # Scryfall API base URL (point it at a local stub for testing) and how
+    # long its responses are served from the http_cache table before they
+    # are revalidated with If-None-Match / If-Modified-Since
+    SCRYFALL_API_URL = os.environ.get("SCRYFALL_API_URL", "https://api.scryfall.com")
+    SCRYFALL_CACHE_TTL = int(os.environ.get("SCRYFALL_CACHE_TTL", 60 * 60))
+
+    # Fill short result pages from the Scryfall search API. Once a bulk data
+    # import has been loaded the local catalog is authoritative and searches
+    # never leave the database.
+    SCRYFALL_FALLBACK = os.environ.get("SCRYFALL_FALLBACK", "1") == "1"
+
+    # Outbound HTTP limits (app/utils/upstream.py): requests in flight per
+    # host, how long a request may wait for a slot, and the circuit breaker
+    # (consecutive failures before calls pause, and for how long). Request
+    # handlers wait at most UPSTREAM_WAIT_BUDGET seconds for Scryfall before
+    # serving local results; UPSTREAM_WORKERS threads carry on the fetch.
+    UPSTREAM_TIMEOUT = (3.05, float(os.environ.get("UPSTREAM_READ_TIMEOUT", 10)))  # connect, read
+    UPSTREAM_HOST_CONCURRENCY = int(os.environ.get("UPSTREAM_HOST_CONCURRENCY", 8))
+    UPSTREAM_QUEUE_TIMEOUT = 0.5
+    UPSTREAM_BREAKER_THRESHOLD = 5
+    UPSTREAM_BREAKER_COOLDOWN = int(os.environ.get("UPSTREAM_BREAKER_COOLDOWN", 30))
+    UPSTREAM_WAIT_BUDGET = float(os.environ.get("UPSTREAM_WAIT_BUDGET", 1.5))
+    UPSTREAM_WORKERS = int(os.environ.get("UPSTREAM_WORKERS", 4))
+
+    # How the set list is synced with Scryfall when the app starts:
+    # 'background' (default), 'blocking' or 'off' (use flask sync-sets).
+    # Background syncs are skipped if one ran within SET_SYNC_INTERVAL seconds.
+    SET_SYNC_ON_STARTUP = os.environ.get("SET_SYNC_ON_STARTUP", "background")
+    SET_SYNC_INTERVAL = int(os.environ.get("SET_SYNC_INTERVAL", 24 * 60 * 60))
+
+    # Mana symbols are served from the database and refreshed from
+    # Scryfall's /symbology endpoint in the background at most this often
+    SYMBOLOGY_TTL = int(os.environ.get("SYMBOLOGY_TTL", 24 * 60 * 60))
+
+    # Rendered pages and card grids are cached per catalog version (see
+    # app/utils/fragments.py): up to FRAGMENT_CACHE_SIZE bytes per process,
+    # each for at most FRAGMENT_CACHE_TTL seconds, and also on disk in
+    # FRAGMENT_CACHE_DIR when it is set
+    FRAGMENT_CACHE = os.environ.get("FRAGMENT_CACHE", "1") == "1"
+    FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 64 * 1024 * 1024))
+    FRAGMENT_CACHE_TTL = int(os.environ.get("FRAGMENT_CACHE_TTL", 5 * 60))
+    FRAGMENT_CACHE_DIR = os.environ.get("FRAGMENT_CACHE_DIR") or None
+
+    # "Similar cards" index built by flask build-similar (app/utils/similar.py)
+    SIMILAR_INDEX_DIR = os.environ.get("SIMILAR_INDEX_DIR", os.path.join(BASE_DIR, 'data', 'similar'))
+    SIMILAR_INDEX_DIM = int(os.environ.get("SIMILAR_INDEX_DIM", 512))
+    SIMILAR_CARDS = 12  # Shown on the card page
+
+    # Background downloads of card images and set icons
+    CACHE_IMAGES = os.environ.get("CACHE_IMAGES", "1") == "1"
+    ASSET_WORKERS = int(os.environ.get("ASSET_WORKERS", 4))
+    SCRYFALL_RATE_LIMIT = 10  # requests per second, per Scryfall's API guidelines
 
     # This is the folder where images are stored for web access
     IMAGE_PATH = os.path.join("static", "images")  # Relative for HTML
@@ -0,0 +1,63 @@
+// Card name suggestions for every search box (input[name="query"]).
+// Suggestions come from /api/autocomplete, which answers from an in-memory
+// index; requests are debounced and a newer keystroke aborts the older one.
+(function () {
+    const DEBOUNCE_MS = 120;
+    const cache = new Map();
+
+    function attach(input, index) {
+        const list = document.createElement('datalist');
+        list.id = 'card-name-suggestions-' + index;
+        input.after(list);
+        input.setAttribute('list', list.id);
+        input.setAttribute('autocomplete', 'off');
+
+        let timer = null;
+        let controller = null;
+
+        function show(names) {
+            list.replaceChildren(...names.map(name => {
+                const option = document.createElement('option');
+                option.value = name;
+                return option;
+            }));
+        }
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            // Search syntax (t:goblin, c>=rg, ...) isn't a card name
+            if (query.length < 2 || /[:<>=()"]/.test(query)) {
+                show([]);
+                return;
+            }
+            if (cache.has(query)) {
+                show(cache.get(query));
+                return;
+            }
+            timer = setTimeout(() => {
+                if (controller) {
+                    controller.abort();
+                }
+                controller = new AbortController();
+                fetch('/api/autocomplete?q=' + encodeURIComponent(query), { signal: controller.signal })
+                    .then(response => response.json())
+                    .then(result => {
+                        cache.set(query, result.data);
+                        if (input.value.trim() === query) {
+                            show(result.data);
+                        }
+                    })
+                    .catch(error => {
+                        if (error.name !== 'AbortError') {
+                            console.error('Autocomplete failed:', error);
+                        }
+                    });
+            }, DEBOUNCE_MS);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        document.querySelectorAll('input[name="query"]').forEach(attach);
+    });
+})();
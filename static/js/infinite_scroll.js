@@ -1,10 +1,17 @@
-let page = 1;
 let loading = false;
 let endOfCards = false;
 
-function getFetchUrl() {
+// The server appends a .scroll-cursor marker to every page that has a
+// successor; its token continues the listing right after the last card.
+function getCursorMarker() {
+    const markers = document.querySelectorAll('#card-list .scroll-cursor');
+    return markers.length ? markers[markers.length - 1] : null;
+}
+
+function getFetchUrl(cursor) {
     const currentUrl = new URL(window.location.href);
-    currentUrl.searchParams.set('page', page + 1);
+    currentUrl.searchParams.delete('page');
+    currentUrl.searchParams.set('cursor', cursor);
     console.log('Fetching URL:', currentUrl.toString());
     return currentUrl.toString();
 }
@@ -15,11 +22,17 @@ function fetchMoreCards() {
         return;
     }
 
+    const marker = getCursorMarker();
+    if (!marker) {
+        endOfCards = true;
+        return;
+    }
+
     loading = true;
-    console.log('Fetching more cards - page:', page + 1);
+    console.log('Fetching more cards after cursor:', marker.dataset.nextCursor);
     showLoading();
 
-    fetch(getFetchUrl(), {
+    fetch(getFetchUrl(marker.dataset.nextCursor), {
         headers: {
             'X-Requested-With': 'XMLHttpRequest'
         }
@@ -51,9 +64,11 @@ function fetchMoreCards() {
                 '<p>No more cards to load</p></div>'
             );
         } else {
+            marker.remove();
             cardList.insertAdjacentHTML('beforeend', html);
-            page += 1;
-            console.log('Updated page to:', page);
+            if (!getCursorMarker()) {
+                endOfCards = true;
+            }
         }
     })
     .catch(error => {
@@ -0,0 +1,34 @@
+import pytest
+from flask import Flask
+
+from app.models import db
+from app.utils.migrations import upgrade_schema
+from app.utils.storage import init_storage
+from app.utils.upstream import configure_upstream
+from bench.stub_scryfall import start_stub
+
+
+@pytest.fixture(scope="session")
+def stub():
+    server, stub = start_stub()
+    yield stub
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory, stub):
+    """One app for the whole run: the write queue is per process and stays bound to it"""
+    app = Flask(__name__)
+    app.config.from_object("config.Config")
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path_factory.mktemp('db') / 'cards.db'}"
+    app.config["SCRYFALL_API_URL"] = stub.base_url
+    # The failure tests would otherwise open the circuit for the stub's host
+    app.config["UPSTREAM_BREAKER_THRESHOLD"] = 1000
+    configure_upstream(app)
+    db.init_app(app)
+    with app.app_context():
+        init_storage(app)
+        db.create_all()
+        upgrade_schema()
+        yield app
+        db.session.remove()
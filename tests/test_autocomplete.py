@@ -0,0 +1,30 @@
+import pytest
+
+from app.models import db
+from app.utils.autocomplete import autocomplete
+from app.utils.importer import CardBatchWriter
+
+
+def write(card, incremental=False):
+    writer = CardBatchWriter(db.session, incremental=incremental)
+    writer.add(card)
+    writer.flush()
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_renamed_card_replaces_its_old_name(app, incremental):
+    old_name, new_name = f"Zyxold Name {incremental}", f"Zyxnew Name {incremental}"
+    card = {
+        "id": f"00000000-0000-4000-8000-00000000500{incremental:d}",
+        "oracle_id": f"00000000-0000-4000-9000-00000000500{incremental:d}",
+        "name": old_name,
+        "type_line": "Instant",
+        "set": "tst",
+    }
+    write(card)
+    assert autocomplete(old_name) == [old_name]
+
+    card["name"] = new_name
+    write(card, incremental)
+    assert autocomplete(new_name) == [new_name]
+    assert autocomplete(old_name) == []
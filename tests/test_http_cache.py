@@ -0,0 +1,110 @@
+import threading
+
+import pytest
+import requests
+
+from app.models import db
+from app.utils.assets import get_http_session
+from app.utils.http_cache import api_url, cached_get
+from app.utils.storage import run_write
+from bench.stub_scryfall import start_stub
+
+SEARCH = "/cards/search"
+
+
+def _noop():
+    pass
+
+
+def wait_for_writes():
+    """Let the write queue commit the cache entries queued so far"""
+    db.session.remove()
+    run_write(_noop)
+
+
+def search(query, ttl=3600, base_url=None):
+    url = (base_url + SEARCH) if base_url else api_url(SEARCH)
+    return cached_get(url, params={"q": query}, ttl=ttl)
+
+
+def hits(stub, counter="hits"):
+    return getattr(stub, counter).get(SEARCH, 0)
+
+
+@pytest.fixture
+def slow_stub(stub):
+    stub.latency = 0.3
+    yield stub
+    stub.latency = 0.0
+
+
+@pytest.fixture
+def failing_stub(stub):
+    stub.fail_status = 503
+    yield stub
+    stub.fail_status = None
+
+
+def test_concurrent_identical_calls_share_one_fetch(app, slow_stub):
+    before = hits(slow_stub)
+    responses = []
+
+    def fetch():
+        with app.app_context():
+            responses.append(search("coalesce").status_code)
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert responses == [200] * 8
+    assert hits(slow_stub) == before + 1
+
+
+def test_fresh_entry_is_served_without_a_request(app, stub):
+    first = search("fresh")
+    wait_for_writes()
+    before = hits(stub)
+    second = search("fresh")
+    assert hits(stub) == before
+    assert second.from_cache and second.content == first.content
+
+
+def test_expired_entry_is_revalidated(app, stub):
+    first = search("revalidate")
+    wait_for_writes()
+    before, conditional_before = hits(stub), hits(stub, "conditional_hits")
+    second = search("revalidate", ttl=0)
+    assert hits(stub) == before + 1
+    assert hits(stub, "conditional_hits") == conditional_before + 1  # Sent If-None-Match; the stub answered 304
+    assert second.from_cache and second.content == first.content
+
+
+def test_server_error_serves_stale_entry(app, stub):
+    first = search("server-error")
+    wait_for_writes()
+    stub.fail_status = 503
+    before = hits(stub)
+    try:
+        stale = search("server-error", ttl=0)
+    finally:
+        stub.fail_status = None
+    assert hits(stub) > before
+    assert stale.status_code == 200 and stale.from_cache and stale.content == first.content
+
+
+def test_connection_error_serves_stale_entry(app):
+    server, other = start_stub()
+    first = search("unreachable", base_url=other.base_url)
+    wait_for_writes()
+    server.shutdown()
+    server.server_close()
+    get_http_session().close()  # Drop the kept-alive connection to it too
+    stale = search("unreachable", ttl=0, base_url=other.base_url)
+    assert stale.status_code == 200 and stale.from_cache and stale.content == first.content
+
+
+def test_error_without_an_entry_is_raised(app, failing_stub):
+    with pytest.raises(requests.RequestException):
+        search("never-cached")
@@ -0,0 +1,103 @@
+import pytest
+from sqlalchemy import event
+
+from app.models import db, Card
+from app.utils.importer import CardBatchWriter, ingest_scryfall_cards
+from app.utils.storage import run_write
+
+PAGE_SIZE = 175  # cards per Scryfall search page
+# Writing a page takes a fixed handful of statements (one IN lookup, the
+# Color/Type preload, one executemany per table) plus the write queue's
+# transaction control; per-card writes would run to hundreds
+MAX_STATEMENTS_PER_PAGE = 20
+
+COLORS = ["W", "U", "B", "R", "G"]
+TYPE_LINES = ["Creature — Goblin", "Instant", "Sorcery", "Legendary Artifact", "Land"]
+
+
+def scryfall_page(start, size=PAGE_SIZE):
+    """A page of Scryfall card objects whose optional fields vary from card to card"""
+    cards = []
+    for n in range(start, start + size):
+        card = {
+            "id": f"00000000-0000-4000-8000-{n:012d}",
+            "oracle_id": f"00000000-0000-4000-9000-{n:012d}",
+            "name": f"Test Card {n}",
+            "layout": "normal",
+            "cmc": n % 7,
+            "type_line": TYPE_LINES[n % len(TYPE_LINES)],
+            "colors": COLORS[:n % 3],
+            "rarity": "common",
+            "collector_number": str(n),
+            "set": "tst",
+            "lang": "en",
+            "released_at": "2024-01-01",
+            "legalities": {"modern": "legal"},
+        }
+        # Each card leaves out a different mix of fields, like real pages do
+        if n % 2:
+            card["mana_cost"] = "{1}{R}"
+            card["oracle_text"] = "Haste"
+        if n % 3:
+            card["power"], card["toughness"] = "2", "2"
+        if n % 5:
+            card["image_uris"] = {"normal": f"https://example.invalid/{n}.jpg"}
+        if n % 7 == 0:
+            card["loyalty"] = "3"
+        cards.append(card)
+    return cards
+
+
+def count_statements(fn, *args):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = fn(*args)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return result, statements
+
+
+def test_page_ingest_statement_count_is_bounded(app):
+    page = scryfall_page(0)
+    inserted, statements = count_statements(run_write, ingest_scryfall_cards, page)
+    assert inserted == PAGE_SIZE
+    assert db.session.query(Card).filter(Card.id.in_([card["id"] for card in page])).count() == PAGE_SIZE
+    assert len(statements) <= MAX_STATEMENTS_PER_PAGE, "\n".join(statements)
+
+
+def test_statement_count_does_not_grow_with_page_size(app):
+    _, small = count_statements(run_write, ingest_scryfall_cards, scryfall_page(1000, size=10))
+    _, large = count_statements(run_write, ingest_scryfall_cards, scryfall_page(2000))
+    assert len(large) <= len(small)
+
+
+def test_known_cards_are_skipped(app):
+    page = scryfall_page(3000)
+    run_write(ingest_scryfall_cards, page)
+    inserted, statements = count_statements(run_write, ingest_scryfall_cards, page)
+    assert inserted == 0
+    assert not [statement for statement in statements if statement.startswith(("INSERT", "UPDATE", "DELETE"))]
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_reimport_replaces_colors_and_types(app, incremental):
+    card = scryfall_page(4000 + incremental, size=1)[0]
+    card.update(colors=["R"], type_line="Creature — Goblin")
+    writer = CardBatchWriter(db.session)
+    writer.add(card)
+    writer.flush()
+
+    card.update(colors=["G"], type_line="Artifact")
+    writer = CardBatchWriter(db.session, incremental=incremental)
+    writer.add(card)
+    writer.flush()
+
+    db.session.expire_all()
+    stored = db.session.get(Card, card["id"])
+    assert [color.name for color in stored.colors] == ["G"]
+    assert [card_type.name for card_type in stored.types] == ["Artifact"]